@@ -0,0 +1,367 @@
+"""
+A small stand-in for the parts of the GitHub API IssueCrawler uses, so the GitHub client can be exercised and
+benchmarked without touching github.com. Point the bot at it with ``GITHUB_API_URL=http://127.0.0.1:8081``.
+
+Run it on its own with ``python -m benchmarks.fakeGithub --port 8081``.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from aiohttp import web, ClientSession
+
+MUTATION_FIELD = re.compile(r"m(\d+): (addComment|updateIssue)\(input: \{(.*?)\}\)")
+
+
+def now():
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class NotFound(Exception):
+    pass
+
+
+class FakeGitHub:
+    """
+    Keeps repositories, issues, comments and labels in memory and serves them like GitHub does, including
+    pagination links, ETags, ``X-RateLimit-*`` headers and webhooks.
+    ``latency`` (plus up to ``jitter``) seconds are added to every response, ``error_rate`` of the requests fail
+    with a 502 and ``secondary_rate`` of them hit a secondary rate limit. Once ``rate_limit`` charged requests
+    are used up the server answers 403 until the window resets.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, secondary_rate=0.0, rate_limit=5000, window=3600,
+                 webhook_url=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.secondary_rate = secondary_rate
+        self.rate_limit = rate_limit
+        self.window = window
+        self.webhook_url = webhook_url
+        self.random = random.Random(seed)
+
+        self.repos = {}
+        self.remaining = rate_limit
+        self.reset = int(time.time()) + window
+        self.requests = Counter()
+        self.deliveries = []
+        self.runner = None
+        self.session = None
+        self.url = None
+
+        self.app = web.Application(middlewares=[self.middleware])
+        self.app.router.add_get('/rate_limit', self.get_rate_limit)
+        self.app.router.add_get('/orgs/{owner}/repos', self.list_repos)
+        self.app.router.add_get('/repos/{owner}/{name}', self.get_repo)
+        self.app.router.add_get('/repos/{owner}/{name}/issues', self.list_issues)
+        self.app.router.add_post('/repos/{owner}/{name}/issues', self.create_issue)
+        self.app.router.add_get('/repos/{owner}/{name}/issues/{number}', self.get_issue)
+        self.app.router.add_patch('/repos/{owner}/{name}/issues/{number}', self.edit_issue)
+        self.app.router.add_get('/repos/{owner}/{name}/issues/{number}/comments', self.list_comments)
+        self.app.router.add_post('/repos/{owner}/{name}/issues/{number}/comments', self.create_comment)
+        self.app.router.add_get('/repos/{owner}/{name}/labels', self.list_labels)
+        self.app.router.add_post('/graphql', self.graphql)
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self.session = ClientSession()
+        return self.url
+
+    async def stop(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    # ===== state =====
+    def repo(self, full_name):
+        if full_name not in self.repos:
+            labels = ['bug', 'featurereq', 'support', 'enhancement', 'P0: Critical', 'P1: Very High', 'P2: High',
+                      'P3: Medium', 'P4: Low', 'P5: Trivial', '+10', '+15']
+            self.repos[full_name] = {
+                "id": len(self.repos) + 1, "full_name": full_name, "name": full_name.split("/")[1],
+                "labels": {name: f"LA_{len(self.repos)}_{i}" for i, name in enumerate(labels)},
+                "issues": {}, "comments": {}
+            }
+        return self.repos[full_name]
+
+    def add_issue(self, full_name, title, body="", labels=(), state="open"):
+        repo = self.repo(full_name)
+        number = len(repo['issues']) + 1
+        stamp = now()
+        issue = {
+            "number": number, "node_id": f"I_{repo['id']}_{number}", "title": title, "body": body, "state": state,
+            "labels": [], "comments": 0, "user": {"login": "fake"}, "created_at": stamp, "updated_at": stamp,
+            "closed_at": stamp if state == "closed" else None,
+            "html_url": f"https://github.com/{full_name}/issues/{number}"
+        }
+        self.set_labels(repo, issue, labels)
+        repo['issues'][number] = issue
+        repo['comments'][number] = []
+        return issue
+
+    def seed(self, full_name, count, closed_every=3):
+        """Fills a repository with ``count`` issues, every ``closed_every``-th one closed."""
+        for i in range(count):
+            state = "closed" if closed_every and i % closed_every == closed_every - 1 else "open"
+            self.add_issue(full_name, f"Seeded issue {i + 1}", "Seeded by the fake GitHub.", ["bug"], state)
+
+    @staticmethod
+    def set_labels(repo, issue, names):
+        for name in names:
+            if name not in repo['labels']:
+                repo['labels'][name] = f"LA_{repo['id']}_{len(repo['labels'])}"
+        issue['labels'] = [{"id": repo['labels'][name], "name": name} for name in names]
+
+    def find_issue(self, request):
+        repo = self.repo(f"{request.match_info['owner']}/{request.match_info['name']}")
+        issue = repo['issues'].get(int(request.match_info['number']))
+        if issue is None:
+            raise NotFound()
+        return repo, issue
+
+    def apply(self, repo, issue, fields):
+        events = []
+        if "title" in fields:
+            issue['title'] = fields['title']
+            events.append("edited")
+        if "body" in fields:
+            issue['body'] = fields['body']
+            events.append("edited")
+        if "labels" in fields:
+            self.set_labels(repo, issue, fields['labels'])
+            events.append("labeled")
+        if "state" in fields and fields['state'] != issue['state']:
+            issue['state'] = fields['state']
+            issue['closed_at'] = now() if fields['state'] == "closed" else None
+            events.append("closed" if fields['state'] == "closed" else "reopened")
+        issue['updated_at'] = now()
+        for action in dict.fromkeys(events):
+            self.deliver("issues", {"action": action, "issue": issue, "repository": self.repository(repo)})
+
+    @staticmethod
+    def repository(repo):
+        return {"id": repo['id'], "full_name": repo['full_name'], "name": repo['name']}
+
+    # ===== plumbing =====
+    @web.middleware
+    async def middleware(self, request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[f"{request.method} {route}"] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+
+        if time.time() >= self.reset:
+            self.remaining = self.rate_limit
+            self.reset = int(time.time()) + self.window
+        if self.remaining <= 0:
+            self.requests["rate limited"] += 1
+            return self.respond({"message": "API rate limit exceeded"}, 403)
+        if self.random.random() < self.secondary_rate:
+            self.requests["secondary limited"] += 1
+            return self.respond({"message": "You have exceeded a secondary rate limit."}, 403, {"Retry-After": "1"})
+        if self.random.random() < self.error_rate:
+            self.requests["errors"] += 1
+            return self.respond({"message": "Server Error"}, 502)
+
+        try:
+            response = await handler(request)
+        except NotFound:
+            response = self.respond({"message": "Not Found"}, 404)
+        if request.method == "GET" and response.status == 200:
+            etag = f'"{hashlib.md5(response.body).hexdigest()}"'
+            response.headers['ETag'] = etag
+            if request.headers.get("If-None-Match") == etag:
+                self.requests["not modified"] += 1
+                return self.respond(None, 304, {"ETag": etag})
+        self.remaining -= 1
+        self.rate_headers(response.headers)
+        return response
+
+    def rate_headers(self, headers):
+        headers['X-RateLimit-Limit'] = str(self.rate_limit)
+        headers['X-RateLimit-Remaining'] = str(max(self.remaining, 0))
+        headers['X-RateLimit-Reset'] = str(self.reset)
+        headers['X-RateLimit-Used'] = str(self.rate_limit - max(self.remaining, 0))
+
+    def respond(self, data, status=200, headers=None):
+        if data is None:
+            response = web.Response(status=status, headers=headers)
+        else:
+            response = web.json_response(data, status=status, headers=headers)
+        self.rate_headers(response.headers)
+        return response
+
+    def deliver(self, event, payload):
+        if self.webhook_url is None:
+            return
+        asyncio.get_event_loop().create_task(self.post_webhook(event, json.dumps(payload)))
+
+    async def post_webhook(self, event, body):
+        headers = {"User-Agent": "GitHub-Hookshot/fake", "X-GitHub-Event": event, "Content-Type": "application/json"}
+        start = time.monotonic()
+        try:
+            async with self.session.post(self.webhook_url, data=body, headers=headers) as resp:
+                await resp.read()
+                self.deliveries.append((event, resp.status, time.monotonic() - start))
+        except Exception as e:
+            self.deliveries.append((event, str(e), time.monotonic() - start))
+
+    # ===== endpoints =====
+    async def get_rate_limit(self, request):
+        core = {"limit": self.rate_limit, "remaining": max(self.remaining, 0), "reset": self.reset,
+                "used": self.rate_limit - max(self.remaining, 0)}
+        return self.respond({"resources": {"core": core, "graphql": core}, "rate": core})
+
+    async def list_repos(self, request):
+        owner = request.match_info['owner']
+        repos = [self.repository(r) for name, r in self.repos.items() if name.startswith(f"{owner}/")]
+        return self.page(request, repos)
+
+    async def get_repo(self, request):
+        return self.respond(self.repository(self.repo(f"{request.match_info['owner']}/{request.match_info['name']}")))
+
+    async def list_issues(self, request):
+        repo = self.repo(f"{request.match_info['owner']}/{request.match_info['name']}")
+        state = request.query.get("state", "open")
+        since = request.query.get("since")
+        issues = [i for i in repo['issues'].values() if state == "all" or i['state'] == state]
+        if since:
+            issues = [i for i in issues if i['updated_at'] >= since]
+        if request.query.get("sort") == "updated":
+            issues.sort(key=lambda i: i['updated_at'])
+        if request.query.get("direction", "desc") == "desc":
+            issues.reverse()
+        return self.page(request, issues)
+
+    def page(self, request, items):
+        per_page = int(request.query.get("per_page", 30))
+        page = int(request.query.get("page", 1))
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(items):
+            query = dict(request.query, page=str(page + 1))
+            url = request.url.with_query(query)
+            headers['Link'] = f'<{url}>; rel="next"'
+        return self.respond(items[start:start + per_page], headers=headers)
+
+    async def create_issue(self, request):
+        data = await request.json()
+        full_name = f"{request.match_info['owner']}/{request.match_info['name']}"
+        issue = self.add_issue(full_name, data['title'], data.get('body', ''), data.get('labels', []))
+        self.deliver("issues", {"action": "opened", "issue": issue, "repository": self.repository(self.repo(full_name))})
+        return self.respond(issue, 201)
+
+    async def get_issue(self, request):
+        _, issue = self.find_issue(request)
+        return self.respond(issue)
+
+    async def edit_issue(self, request):
+        repo, issue = self.find_issue(request)
+        self.apply(repo, issue, await request.json())
+        return self.respond(issue)
+
+    async def list_comments(self, request):
+        repo, issue = self.find_issue(request)
+        return self.page(request, repo['comments'][issue['number']])
+
+    async def create_comment(self, request):
+        repo, issue = self.find_issue(request)
+        data = await request.json()
+        comment = {"id": sum(len(c) for c in repo['comments'].values()) + 1, "body": data['body'],
+                   "user": {"login": "fake"}, "created_at": now()}
+        repo['comments'][issue['number']].append(comment)
+        issue['comments'] += 1
+        self.deliver("issue_comment", {"action": "created", "issue": issue, "comment": comment,
+                                       "repository": self.repository(repo)})
+        return self.respond(comment, 201)
+
+    async def list_labels(self, request):
+        repo = self.repo(f"{request.match_info['owner']}/{request.match_info['name']}")
+        return self.page(request, [{"id": i, "name": name} for name, i in repo['labels'].items()])
+
+    async def graphql(self, request):
+        data = await request.json()
+        query = data['query']
+        variables = data.get('variables', {})
+        if query.lstrip().startswith("mutation"):
+            return self.respond({"data": self.mutate(query, variables)})
+
+        repo = self.repo(f"{variables['owner']}/{variables['name']}")
+        issue = repo['issues'].get(variables['number'])
+        return self.respond({"data": {"repository": {
+            "issue": {"id": issue['node_id']} if issue else None,
+            "labels": {"nodes": [{"id": i, "name": name} for name, i in repo['labels'].items()]}
+        }}})
+
+    def mutate(self, query, variables):
+        issues = {i['node_id']: (r, i) for r in self.repos.values() for i in r['issues'].values()}
+        result = {}
+        for index, mutation, arguments in MUTATION_FIELD.findall(query):
+            repo, issue = issues[variables['issue']]
+            if mutation == "addComment":
+                repo['comments'][issue['number']].append({"body": variables[f"body{index}"], "user": {"login": "fake"}})
+                issue['comments'] += 1
+            else:
+                fields = {}
+                if f"$title{index}" in arguments:
+                    fields['title'] = variables[f"title{index}"]
+                if f"$labels{index}" in arguments:
+                    names = {i: name for name, i in repo['labels'].items()}
+                    fields['labels'] = [names[i] for i in variables[f"labels{index}"]]
+                if "state: CLOSED" in arguments:
+                    fields['state'] = "closed"
+                elif "state: OPEN" in arguments:
+                    fields['state'] = "open"
+                self.apply(repo, issue, fields)
+            result[f"m{index}"] = {"clientMutationId": None}
+        return result
+
+
+async def serve(args):
+    fake = FakeGitHub(args.latency, args.jitter, args.error_rate, args.secondary_rate, args.rate_limit,
+                      webhook_url=args.webhook)
+    for repo in args.seed:
+        name, _, count = repo.partition(":")
+        fake.seed(name, int(count or 100))
+    url = await fake.start(args.host, args.port)
+    print(f"Fake GitHub listening on {url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake GitHub API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 502")
+    parser.add_argument("--secondary-rate", type=float, default=0.0,
+                        help="fraction of requests hitting a secondary rate limit")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="charged requests per hour")
+    parser.add_argument("--webhook", default=None, help="where to deliver webhooks, e.g. http://127.0.0.1:2771/github")
+    parser.add_argument("--seed", nargs="*", default=[], help="repositories to fill, as owner/name:count")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures the GitHub client against the fake GitHub: raw throughput under mixed priorities, how many body rewrites
+the coalescer saves, how many reads the conditional cache answers with a 304 and how fast pagination is.
+
+Run it with ``python -m benchmarks.githubThroughput``; it needs the same environment as the bot.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakeGithub import FakeGitHub
+from models.githubClient import GitHubClient
+from models.githubRest import GitHubRest
+from models.githubScheduler import GitHubScheduler, HIGH, NORMAL, LOW
+
+REPO = "bench/tracker"
+
+
+def report(name, seconds, requests, **extra):
+    line = f"{name:<14} {seconds:8.2f}s {requests:6d} requests {requests / seconds if seconds else 0:8.1f} req/s"
+    for key, value in extra.items():
+        line += f"  {key}={value}"
+    print(line)
+
+
+def total(fake):
+    return sum(count for key, count in fake.requests.items() if " /" in key)
+
+
+async def throughput(client, fake, operations):
+    """Comments, label changes and closes on the same issues at once; the closes should finish first."""
+    before = total(fake)
+    finished = {HIGH: [], NORMAL: [], LOW: []}
+    start = time.monotonic()
+
+    async def timed(priority, coro):
+        await coro
+        finished[priority].append(time.monotonic() - start)
+
+    work = []
+    for i in range(operations):
+        num = i % 50 + 1
+        if i % 10 == 0:
+            work.append(timed(HIGH, client.close_issue(REPO, num)))
+        elif i % 3 == 0:
+            work.append(timed(LOW, client.edit_issue_body(REPO, num, f"Body {i}")))
+        else:
+            work.append(timed(NORMAL, client.add_issue_comment(REPO, num, f"Comment {i}")))
+    results = await asyncio.gather(*work, return_exceptions=True)
+    seconds = time.monotonic() - start
+    done = {p: f"{sum(t) / len(t):.2f}s" for p, t in finished.items() if t}
+    failed = sum(isinstance(r, Exception) for r in results)
+    report("throughput", seconds, total(fake) - before, mean_done=done, failed=failed)
+
+
+async def coalescing(client, fake, issues, edits):
+    """``edits`` body rewrites for each of ``issues`` issues, submitted as fast as possible."""
+    before = total(fake)
+    start = time.monotonic()
+    futures = [client.queue_issue_body(REPO, num, f"Body {num}.{edit}")
+               for edit in range(edits) for num in range(1, issues + 1)]
+    await asyncio.gather(*futures, return_exceptions=True)
+    stats = client.coalesced_bodies()
+    report("coalescing", time.monotonic() - start, total(fake) - before,
+           requested=stats['requested'], written=stats['written'])
+
+
+async def conditional(client, fake, reads):
+    """Re-reads the same issues; after the first round GitHub should answer 304 to nearly all of them."""
+    before = total(fake)
+    start = time.monotonic()
+    for i in range(reads):
+        await client.get_issue(REPO, i % 20 + 1)
+    stats = client.conditional_cache()
+    report("conditional", time.monotonic() - start, total(fake) - before,
+           not_modified=fake.requests["not modified"], hit_rate=f"{stats['hit_rate']:.0%}")
+
+
+async def pagination(client, fake):
+    before = total(fake)
+    start = time.monotonic()
+    count = 0
+    async for _ in client.client.paginate(f"/repos/{REPO}/issues", {"state": "all"}):
+        count += 1
+    report("pagination", time.monotonic() - start, total(fake) - before, issues=count)
+
+
+async def main(args):
+    fake = FakeGitHub(args.latency, args.jitter, args.error_rate, args.secondary_rate, args.hourly_limit, seed=1)
+    fake.seed(REPO, args.issues)
+    url = await fake.start()
+
+    client = GitHubClient("fake-token", [])
+    client.client = GitHubRest("fake-token", url, scheduler=GitHubScheduler(args.hourly_limit, args.burst))
+    client.bodies.window = args.window
+    try:
+        await throughput(client, fake, args.operations)
+        await coalescing(client, fake, 20, args.edits)
+        await conditional(client, fake, args.reads)
+        await pagination(client, fake)
+        print(f"scheduler      {client.rate_limit()['default']}")
+        print(f"fake github    {dict(fake.requests)}")
+    finally:
+        await client.client.close()
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the GitHub client against a fake GitHub.")
+    parser.add_argument("--issues", type=int, default=1000, help="issues seeded into the fake repository")
+    parser.add_argument("--operations", type=int, default=1000, help="mixed writes in the throughput run")
+    parser.add_argument("--edits", type=int, default=25, help="body rewrites per issue in the coalescing run")
+    parser.add_argument("--reads", type=int, default=500, help="issue reads in the conditional run")
+    parser.add_argument("--window", type=float, default=0.5, help="coalescing window in seconds")
+    parser.add_argument("--hourly-limit", type=int, default=360000, help="rate limit of the fake and the scheduler")
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--secondary-rate", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
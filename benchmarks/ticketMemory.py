@@ -0,0 +1,93 @@
+"""
+Per-ticket memory and hydration time of a popular ticket, compared with plain dict-backed objects.
+
+Run it with ``python -m benchmarks.ticketMemory --attachments 10000``; it needs the same environment as the bot.
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+
+from models.ticket import Ticket
+
+
+class DictAttachment:
+    """The attachment as it was before it got slots."""
+
+    def __init__(self, author, message='', veri=0):
+        self.author = author
+        self.message = message or None
+        self.veri = veri
+
+
+def ticket_dict(attachments, legacy=False):
+    """A stored ticket; with ``legacy`` one from before the vote index, which is rebuilt while loading."""
+    votes = [{"author": 100000000000000000 + i, "message": None, "veri": 2 if i % 3 else -2} for i in range(attachments)]
+    votes[0] = {"author": 1, "message": "The original request.", "veri": 0}
+    data = {
+        'reporter': 1, 'ticket_id': "BENCH-1", 'title': "A popular feature request", 'severity': 6,
+        'verification': 0, 'upvotes': attachments, 'downvotes': 0, 'shrugs': 0, 'attachments': votes,
+        'message': 1, 'github_issue': 1, 'github_repo': "bench/tracker", 'subscribers': [1], 'is_bug': False,
+        'is_support': False, 'jumpUrl': None, 'trackerId': 1, 'assignee': None, 'milestone': [], 'opened': 0,
+        'closed': None, 'thread': None, 'server_id': 1, 'last_updated': 0
+    }
+    if not legacy:
+        data['votes'] = {str(v['author']): v['veri'] for v in votes[1:]}
+        data['repros'] = {}
+        data['version'] = 1
+    return data
+
+
+def timed(fn, data, rounds):
+    copies = [copy.deepcopy(data) for _ in range(rounds)]
+    start = time.perf_counter()
+    for d in copies:
+        fn(d)
+    return (time.perf_counter() - start) / rounds
+
+
+def measured(fn, data):
+    data = copy.deepcopy(data)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = fn(data)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del result
+    return size
+
+
+def lazy(data):
+    return Ticket.from_dict(data)
+
+
+def hydrated(data):
+    ticket = Ticket.from_dict(data)
+    ticket.attachments  # noqa, forces the attachment objects to be built
+    return ticket
+
+
+def dict_backed(data):
+    attachments = [DictAttachment(**a) for a in data['attachments']]
+    return dict(data, attachments=attachments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ticket hydration time and memory.")
+    parser.add_argument("--attachments", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{args.attachments} attachments, {args.rounds} rounds")
+    for case, legacy in (("stored with a vote index", False), ("legacy, the index is rebuilt", True)):
+        data = ticket_dict(args.attachments, legacy)
+        print(case)
+        for name, fn in (("dict-backed", dict_backed), ("slotted", hydrated), ("lazy", lazy)):
+            seconds = timed(fn, data, args.rounds)
+            size = measured(fn, data)
+            print(f"  {name:<12} {seconds * 1000:8.2f} ms/ticket {size / 1024:10.1f} KiB/ticket (on top of the raw document)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import asyncio
 import csv
 import io
+import time
 from typing import Union
 
 import discord
@@ -8,6 +10,7 @@ from discord.abc import GuildChannel
 from discord.ext import commands
 
 import utils.globals as GG
+from models.importer import IssueImporter, DONE
 from models.server import Server, Listen
 from utils.autocomplete import get_server_identifiers, get_server_identifiers_no_alias
 from utils.checks import is_manager
@@ -36,6 +39,7 @@ async def find_in_tickets(db, identifier, searchTerm):
 class Issue(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.imports = {}
 
     issue = SlashCommandGroup("issue", "All commands that have effect on the issue tracker", checks=[commands.guild_only().predicate])
 
@@ -289,6 +293,56 @@ class Issue(commands.Cog):
             if listen is None:
                 return await identifier_does_not_exist(ctx, identifier)
 
+    @issue.command(name="import")
+    @discord.default_permissions(
+        administrator=True,
+    )
+    async def import_issues(self,
+                            ctx,
+                            identifier: Option(str, "Into which identifier do you want to import the issues?",
+                                               autocomplete=get_server_identifiers_no_alias),
+                            repo: Option(str, "The GitHub repository to import, as owner/name")):
+        """Imports all existing issues of a GitHub repository as tickets. Running it again resumes the import."""
+        identifier = identifier.upper()
+        server = await GG.MDB.Github.find_one({"server": ctx.guild.id})
+        listen = next((x for x in server['listen'] if x['identifier'] == identifier), None)
+        if listen is None:
+            return await identifier_does_not_exist(ctx, identifier)
+
+        importer = IssueImporter(self.bot, repo, identifier, ctx.guild.id, listen['tracker'])
+        if importer.job_id in self.imports:
+            return await ctx.respond(f"``{repo}`` is already being imported into ``{identifier}``.", ephemeral=True)
+
+        await ctx.respond(f"Importing the issues of ``{repo}`` into ``{identifier}``...")
+        status = await ctx.channel.send(f"``{repo}``: starting...")
+        last_edit = 0
+
+        async def progress(job):
+            nonlocal last_edit
+            if job['state'] != DONE and time.monotonic() - last_edit < 5:
+                return
+            last_edit = time.monotonic()
+            line = f"``{repo}``: {job['seen']} issues read, {job['imported']} imported, {job['skipped']} already tracked, " \
+                   f"{job['posted']} tracker messages posted."
+            if job['state'] == DONE:
+                line += " Done!"
+            try:
+                await status.edit(content=line)
+            except discord.HTTPException:
+                pass
+
+        importer.progress = progress
+
+        async def run():
+            try:
+                await importer.run()
+            except Exception as e:
+                await ctx.channel.send(f"Importing ``{repo}`` stopped: {e}\nRun the command again to resume.")
+            finally:
+                self.imports.pop(importer.job_id, None)
+
+        self.imports[importer.job_id] = asyncio.get_event_loop().create_task(run())
+
 
 def setup(bot):
     log.info("[Cogs] Issue...")
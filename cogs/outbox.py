@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+from discord.ext import commands, tasks
+
+from models.githubClient import GitHubClient
+from models.githubRest import GitHubException
+from models.outbox import GitHubOutbox, PENDING, RUNNING, DONE, FAILED
+from models.ticket import Ticket
+
+from utils import globals as GG
+log = GG.log
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 900
+STREAMS = 500  # streams started per round
+BATCH = 100  # entries of one stream read at once
+
+
+class TicketNotStored(Exception):
+    pass
+
+
+class Outbox(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.collection = GitHubOutbox.collection
+        self.tickets = GG.MDB['Tickets']
+        self.active = {}
+        self.semaphore = None
+        self.drain.start()
+
+    def cog_unload(self):
+        self.drain.cancel()
+        for task in self.active.values():
+            task.cancel()
+
+    @tasks.loop(seconds=2)
+    async def drain(self):
+        # only streams whose first entry may run now; a stream waiting on a backoff doesn't hold up the others
+        pipeline = [
+            {"$match": {"state": {"$in": [PENDING, RUNNING]}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": "$stream", "head": {"$first": "$_id"}, "state": {"$first": "$state"},
+                        "next_try": {"$first": "$next_try"}}},
+            {"$match": {"state": PENDING, "next_try": {"$lte": time.time()}}},
+            {"$sort": {"head": 1}},
+            {"$limit": STREAMS + len(self.active)},
+        ]
+        try:
+            heads = await self.collection.aggregate(pipeline).to_list(length=None)
+        except Exception as e:
+            log.error(f"[Outbox] Could not read the outbox: {e}")
+            return
+        for head in heads:
+            name = head['_id']
+            if name not in self.active:  # a stream that is still busy picks its new entries up next round
+                self.active[name] = asyncio.get_event_loop().create_task(self.drain_stream(name))
+
+    @drain.before_loop
+    async def before_drain(self):
+        await self.bot.wait_until_ready()
+        self.semaphore = asyncio.Semaphore(50)
+        await GitHubOutbox.ensure_indexes()
+        # anything still running was interrupted by a restart
+        await self.collection.update_many({"state": RUNNING}, {"$set": {"state": PENDING}})
+
+    async def drain_stream(self, name):
+        """Runs the entries of one ticket in order, stopping at the first one that isn't done."""
+        try:
+            entries = await self.collection.find({"stream": name, "state": {"$in": [PENDING, RUNNING]}}) \
+                .sort("_id", 1).to_list(length=BATCH)
+            for entry in entries:
+                if entry['state'] != PENDING or entry['next_try'] > time.time():
+                    return
+                update = {"$set": {"state": RUNNING}}
+                if entry.get('coalesce'):
+                    update["$unset"] = {"key": ""}  # later edits queue up behind this one instead of merging into it
+                entry = await self.collection.find_one_and_update({"_id": entry['_id'], "state": PENDING}, update)
+                if entry is None:
+                    return
+                try:
+                    async with self.semaphore:
+                        result = await self.execute(entry)
+                except Exception as e:
+                    await self.failed(entry, e)
+                    return
+                await self.collection.update_one({"_id": entry['_id']},
+                                                 {"$set": {"state": DONE, "result": result, "finished": time.time()}})
+        finally:
+            self.active.pop(name, None)
+
+    async def failed(self, entry, error):
+        attempts = entry['attempts'] + 1
+        permanent = isinstance(error, GitHubException) and 400 <= error.status < 500 and error.status not in (403, 429)
+        if permanent or attempts >= MAX_ATTEMPTS:
+            log.error(f"[Outbox] Giving up on {entry['action']} for {entry['stream']}: {error}")
+            update = {"state": FAILED, "attempts": attempts, "error": str(error), "finished": time.time()}
+        else:
+            update = {"state": PENDING, "attempts": attempts, "error": str(error),
+                      "next_try": time.time() + min(5 * 2 ** attempts, MAX_BACKOFF)}
+        await self.collection.update_one({"_id": entry['_id']}, {"$set": update})
+
+    async def execute(self, entry):
+        client = GitHubClient.get_instance()
+        action = entry['action']
+        repo = entry['repo']
+        payload = entry['payload']
+
+        if action == "create_issue":
+            ticket = await self.tickets.find_one({"ticket_id": entry['ticket_id']}, {"github_issue": 1})
+            if ticket is None:  # retried with a backoff, the ticket is usually stored a moment later
+                raise TicketNotStored(f"{entry['ticket_id']} isn't stored yet.")
+            if ticket.get('github_issue'):
+                return ticket['github_issue']
+            issue = await client.create_issue(repo, payload['title'], payload['body'], payload['labels'])
+            log.info(f"Adding to Github: {repo}, {entry['ticket_id']}")
+            await self.tickets.update_one({"ticket_id": entry['ticket_id']},
+                                          {"$set": {"github_issue": issue['number']}, "$inc": {"version": 1}})
+            Ticket.cache.invalidate(entry['ticket_id'])
+            return issue['number']
+
+        issue_num = entry['issue'] or await self.issue_of(entry)
+        if not issue_num:
+            return None  # the ticket never made it to GitHub
+
+        if action == "comment":
+            await client.add_issue_comment(repo, issue_num, payload['body'])
+        elif action == "edit":
+            await client.edit_issue(repo, issue_num, payload['priority'], **payload['fields'])
+        elif action == "batch":
+            batch = client.batch(repo, issue_num, payload.get('node_id'))
+            batch.ops = [(op, value) for op, value in payload['ops']]
+            await batch.execute()
+        elif action == "sync_body":
+            # sync_body entries already coalesce on their key, so there is nothing left to wait for
+            await client.edit_issue_body(repo, issue_num, await self.render_body(entry))
+        return issue_num
+
+    async def issue_of(self, entry):
+        if entry['ticket_id'] is None:
+            return None
+        ticket = await self.tickets.find_one({"ticket_id": entry['ticket_id']}, {"github_issue": 1})
+        if ticket is not None and ticket.get('github_issue'):
+            return ticket['github_issue']
+        created = await self.collection.find_one({"key": f"create:{entry['ticket_id']}", "state": DONE})
+        if created is not None:
+            return created['result']
+        return None
+
+    async def render_body(self, entry):
+        data = await self.tickets.find_one({"ticket_id": entry['ticket_id']})
+        del data['_id']
+        ticket = Ticket.from_dict(data)
+        return await ticket.get_github_desc(self.bot, entry['payload']['server_id'])
+
+
+def setup(bot):
+    log.info("[Cogs] Outbox...")
+    bot.add_cog(Outbox(bot))
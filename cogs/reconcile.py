@@ -0,0 +1,75 @@
+import discord
+from discord.ext import commands, tasks
+
+from models.reconciler import GitHubReconciler
+from models.ticket import Ticket
+
+from utils import globals as GG
+log = GG.log
+
+
+class Reconcile(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.reconciler = GitHubReconciler()
+        self.tickets = GG.MDB['Tickets']
+        self.reconcile_loop.start()
+
+    def cog_unload(self):
+        self.reconcile_loop.cancel()
+
+    @tasks.loop(hours=1)
+    async def reconcile_loop(self):
+        try:
+            await self.reconcile()
+        except Exception as e:
+            log.error(f"[Reconcile] Run failed: {e}")
+
+    @reconcile_loop.before_loop
+    async def before_reconcile(self):
+        await self.bot.wait_until_ready()
+        await self.reconciler.watermarks.create_index("repo", unique=True)
+
+    async def reconcile(self, repos=None):
+        report = await self.reconciler.run(repos)
+        for result in report.values():
+            for changed in result.get('changed', []):
+                await self.refresh(changed['ticket_id'])
+        return report
+
+    async def refresh(self, ticket_id):
+        """Brings the tracker message of a ticket the reconciler fixed in line with its new state."""
+        data = await self.tickets.find_one({"ticket_id": ticket_id})
+        if data is None or data.get('server_id') is None:
+            return
+        del data['_id']
+        ticket = Ticket.from_dict(data)
+        ctx = GG.ContextProxy(self.bot)
+        try:
+            if ticket.is_open():
+                await ticket.update(ctx, ticket.server_id)
+            elif ticket.message:
+                await ticket.delete_message(ctx, ticket.server_id)
+                await self.tickets.update_one({"ticket_id": ticket_id}, {"$set": {"message": None}})
+                Ticket.cache.invalidate(ticket_id)
+        except (discord.HTTPException, AttributeError) as e:
+            log.info(f"[Reconcile] Could not refresh the tracker message of {ticket_id}: {e}")
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def reconcile_github(self, ctx, *repos):
+        """Runs the GitHub reconciliation now, for the given repos or all tracked ones."""
+        await ctx.send("Reconciling with GitHub...")
+        report = await self.reconcile(list(repos) or None)
+        lines = []
+        for repo, result in report.items():
+            if 'error' in result:
+                lines.append(f"`{repo}`: failed ({result['error']})")
+            else:
+                lines.append(f"`{repo}`: {result['seen']} issues checked, {result['fixed']} tickets fixed")
+        await ctx.send("\n".join(lines) or "No repositories to reconcile.")
+
+
+def setup(bot):
+    log.info("[Cogs] Reconcile...")
+    bot.add_cog(Reconcile(bot))
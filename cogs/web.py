@@ -4,17 +4,12 @@ from aiohttp import web
 from discord.ext import commands
 
 from models.githubClient import GitHubClient
-from models.ticket import Ticket, TicketException
+from models.outbox import GitHubOutbox
+from models.ticket import Ticket, TicketException, PRI_LABEL_NAMES, BUG_LABEL, FEATURE_LABEL, SUPPORT_LABEL, EXEMPT_LABEL
 
 from utils import globals as GG
 log = GG.log
 
-PRI_LABEL_NAMES = ("P0", "P1", "P2", "P3", "P4", "P5")
-BUG_LABEL = "bug"
-FEATURE_LABEL = "featurereq"
-SUPPORT_LABEL = "support"
-EXEMPT_LABEL = "enhancement"
-
 
 class Web(commands.Cog):
     # this is probably a really hacky way to run a webhook handler, but eh
@@ -59,14 +54,17 @@ class Web(commands.Cog):
         issue_num = issue['number']
         repo_name = data['repository']['full_name']
         try:
-            ticket = Ticket.from_github(repo_name, issue_num)
+            ticket = await Ticket.from_github(repo_name, issue_num)
         except TicketException:  # ticket not found
             return  # oh well
 
         pend = data['sender']['login'] == "lorddusk"
 
-        await ticket.resolve(GG.ContextProxy(self.bot), ticket.repo, close_github_issue=False, pend=pend)
-        await ticket.commit()
+        async def resolve(ticket):
+            await ticket.resolve(GG.ContextProxy(self.bot), ticket.repo, close_github_issue=False, pend=pend)
+            await ticket.commit()
+
+        await ticket.apply(resolve)
 
     async def ticket_opened(self, data):
         issue = data['issue']
@@ -74,26 +72,28 @@ class Web(commands.Cog):
         repo_name = data['repository']['full_name']
         # is the issue new?
         try:
-            ticket = Ticket.from_github(repo_name, issue_num)
+            ticket = await Ticket.from_github(repo_name, issue_num)
         except TicketException:  # ticket not found
             issue_labels = [lab['name'] for lab in issue['labels']]
             if EXEMPT_LABEL in issue_labels:
                 return None
 
             ticket = await Ticket.new_from_issue(repo_name, issue)
+            ops = []
             if not issue['title'].startswith(ticket.ticket_id):
                 formatted_title = f"{ticket.ticket_id} {ticket.title}"
-                await GitHubClient.get_instance().rename_issue(repo_name, issue['number'], formatted_title)
+                ops.append(["title", formatted_title])
 
             # await GitHubClient.get_instance().add_issue_to_project(ticket.github_issue, ticket.is_bug)
-            await GitHubClient.get_instance().add_issue_comment(repo_name, issue['number'],
-                                                                f"Tracked as `{ticket.ticket_id}`.")
-            await ticket.update_labels()
+            ops.append(["comment", f"Tracked as `{ticket.ticket_id}`."])
+            ops.append(["labels", ticket.get_labels()])
+            await GitHubOutbox.batch(repo_name, issue['number'], ops, ticket.ticket_id, issue.get('node_id'))
 
-        await ticket.unresolve(GG.ContextProxy(self.bot), ticket.repo, open_github_issue=False)
-        await ticket.commit()
+        async def unresolve(ticket):
+            await ticket.unresolve(GG.ContextProxy(self.bot), ticket.repo, open_github_issue=False)
+            await ticket.commit()
 
-        return ticket
+        return await ticket.apply(unresolve)
 
     async def ticket_labeled(self, data):
         issue = data['issue']
@@ -107,7 +107,7 @@ class Web(commands.Cog):
             return  # multiple type labels
 
         try:
-            ticket = Ticket.from_github(repo_name, issue_num)
+            ticket = await Ticket.from_github(repo_name, issue_num)
         except TicketException:  # ticket not found
             ticket = await self.ticket_opened(data)
 
@@ -119,15 +119,18 @@ class Web(commands.Cog):
         if EXEMPT_LABEL in label_names:  # issue changed from bug/fr to enhancement
             await ticket.untrack(ctx, ticket.repo)
         else:
-            priority = ticket.severity
-            for i, pri in enumerate(PRI_LABEL_NAMES):
-                if any(pri in n for n in label_names):
-                    priority = i
-                    break
-            ticket.severity = priority
-            ticket.is_bug = BUG_LABEL in label_names
-            ticket.is_support = SUPPORT_LABEL in label_names
-            await ticket.commit()
+            async def relabel(ticket):
+                priority = ticket.severity
+                for i, pri in enumerate(PRI_LABEL_NAMES):
+                    if any(pri in n for n in label_names):
+                        priority = i
+                        break
+                ticket.severity = priority
+                ticket.is_bug = BUG_LABEL in label_names
+                ticket.is_support = SUPPORT_LABEL in label_names
+                await ticket.commit()
+
+            ticket = await ticket.apply(relabel)
             await ticket.update(ctx, ticket.repo)
 
         # ===== github: issue_comment event =====
@@ -139,18 +142,22 @@ class Web(commands.Cog):
         comment = data['comment']
         action = data['action']
         username = comment['user']['login']
-        if username == "crawltracker":
+        app = comment.get('performed_via_github_app') or {}
+        if GG.GITHUB_APP_ID and str(app.get('id')) == str(GG.GITHUB_APP_ID):
             return  # don't infinitely add comments
+        if username in await GitHubClient.get_instance().own_logins():
+            return
 
         # only care about create
         if action == "created":
             try:
-                ticket = Ticket.from_github(repo_name, issue_num)
+                ticket = await Ticket.from_github(repo_name, issue_num)
             except TicketException:
                 return  # oh well
 
-            await ticket.addnote(f"GitHub - {username}", comment['body'], GG.ContextProxy(self.bot), ticket.repo, add_to_github=False)
-            await ticket.commit()
+            ticket = await ticket.apply(lambda ticket: ticket.addnote(f"GitHub - {username}", comment['body'],
+                                                                      GG.ContextProxy(self.bot), ticket.repo,
+                                                                      add_to_github=False))
             await ticket.update(GG.ContextProxy(self.bot))
 
     def run_app(self, app, *, host='0.0.0.0', port=None, ssl_context=None, backlog=128):
@@ -3,7 +3,8 @@ from discord.ext import commands
 
 from crawler_utilities.cogs.stats import track_analytics_event
 from modal.note import Note
-from models.ticket import Ticket, TicketException
+from models.ticket import Ticket, TicketException, TicketNotFound
+from models.ticketQueue import TicketQueue
 from utils.checks import is_manager_assignee_or_creator
 
 from utils import globals as GG
@@ -14,6 +15,29 @@ class HandleTicket(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.userCache = set()
+        self.queue = TicketQueue()
+        self.updater = Ticket.updater
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await Ticket.ensure_indexes()
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        if payload.channel_id in GG.GUILD_TRACKERS.get(payload.guild_id, ()):
+            Ticket.reacted[payload.message_id] = True  # the next update clears it
+
+    @commands.command(hidden=True)
+    @commands.is_owner()
+    async def ticket_cache(self, ctx):
+        """Shows how the ticket cache, the interaction queue and the tracker updates are doing."""
+        cache = Ticket.cache.stats()
+        queue = self.queue.stats()
+        updates = self.updater.stats()
+        await ctx.send(f"Ticket cache: {cache['hit_rate']:.1%} hit rate ({cache['hits']} hits, {cache['misses']} misses), "
+                       f"{cache['entries']} tickets cached, {cache['invalidations']} invalidations.\n"
+                       f"Interactions: {queue['operations']} in {queue['batches']} batches, {queue['queued']} queued.\n"
+                       f"Tracker updates: {updates['requested']} requested, {updates['edits']} made, {updates['pending']} pending.")
 
     @commands.Cog.listener()
     async def on_interaction(self, interaction: Interaction):
@@ -41,31 +65,60 @@ class HandleTicket(commands.Cog):
         if label not in (GG.UPVOTE, GG.DOWNVOTE, GG.INFORMATION, GG.SHRUG, GG.SUBSCRIBE, GG.RESOLVE, GG.NOTE) or member.bot or label is None:
             return
 
-        try:
-            ticket = await Ticket.from_message_id(message.id)
-        except TicketException:
+        async def reply(content):
+            await HandleTicket.send_message(member, interaction, content)
+
+        if label in (GG.INFORMATION, GG.NOTE):  # nothing to store, no need to wait for the queue
+            try:
+                ticket = await Ticket.from_message_id(message.id)
+            except TicketException:
+                return
+            if label == GG.INFORMATION:
+                await track_analytics_event("IssueCrawler", "Information", f"{ticket.ticket_id}", f"{member.id}")
+            await self.handle(interaction, label, member, message, ticket, server, reply)
             return
 
-        if label == GG.INFORMATION:
-            await track_analytics_event("IssueCrawler", "Information", f"{ticket.ticket_id}", f"{member.id}")
+        replies = []
+
+        async def confirm(content):  # answered once the batch is stored, not when the operation ran
+            replies.append(content)
+
+        async def operation(ticket):
+            replies.clear()  # the batch runs again after a conflict
+            await self.handle(interaction, label, member, message, ticket, server, confirm)
+
+        async def after(ticket):  # votes on a hot ticket become one edit per window
+            await ticket.schedule_update(GG.ContextProxy(self.bot, interaction=interaction), server.id)
 
+        try:
+            await self.queue.submit(message.id, lambda: Ticket.from_message_id(message.id), operation, after)
+        except TicketNotFound:
+            return
+        except TicketException as e:
+            await reply(str(e))
+            return
+        except Exception as e:
+            log.error(f"Could not handle {label} on {message.id}: {e}")
+            await reply("Something went wrong, nothing was changed. Please try again.")
+            return
+        for content in replies:
+            await reply(content)
+
+    async def handle(self, interaction, label, member, message, ticket, server, reply):
         if ticket.is_bug or ticket.is_support:
-            await self.handle_bug_or_support(self.bot, interaction, label, member, ticket, server)
+            await self.handle_bug_or_support(self.bot, interaction, label, member, ticket, server, reply)
         else:
             if server.owner_id == member.id:
-                await self.handle_feature_server_owner(self.bot, interaction, label, member, ticket, server)
+                await self.handle_feature_server_owner(self.bot, interaction, label, member, ticket, server, reply)
             else:
-                await self.handle_feature_user(self.bot, interaction, label, member, message, ticket, server)
-
-        await ticket.commit()
-        await ticket.update(GG.ContextProxy(self.bot, interaction=interaction), server.id)
+                await self.handle_feature_user(self.bot, interaction, label, member, message, ticket, server, reply)
 
     @staticmethod
-    async def handle_feature_user(bot, interaction, label, member, message, ticket, server):
+    async def handle_feature_user(bot, interaction, label, member, message, ticket, server, reply):
         if label == GG.UPVOTE:
             print(f"Upvote: {member} - {ticket.ticket_id}")
             await ticket.upvote(member.id, '', GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have upvoted {ticket.ticket_id}")
+            await reply(f"You have upvoted {ticket.ticket_id}")
         elif label == GG.INFORMATION:
             print(f"Information: {member} - {ticket.ticket_id}")
             em = await ticket.get_embed(True)
@@ -73,24 +126,24 @@ class HandleTicket(commands.Cog):
         elif label == GG.SHRUG:
             print(f"Shrugged: {member} - {ticket.ticket_id}")
             await ticket.indifferent(member.id, '', GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have shown indifference for {ticket.ticket_id}")
+            await reply(f"You have shown indifference for {ticket.ticket_id}")
         elif label == GG.SUBSCRIBE:
-            await HandleTicket.subscribe(interaction, member, ticket)
+            await HandleTicket.subscribe(member, ticket, reply)
         elif label == GG.RESOLVE:
-            await HandleTicket.resolve(bot, interaction, member, ticket, server)
+            await HandleTicket.resolve(bot, interaction, member, ticket, server, reply)
         elif label == GG.NOTE:
             await HandleTicket.note(bot, interaction, ticket)
         else:
             print(f"Downvote: {member} - {ticket.ticket_id}")
             await ticket.downvote(member.id, '', GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have downvoted {ticket.ticket_id}")
+            await reply(f"You have downvoted {ticket.ticket_id}")
 
     @staticmethod
-    async def handle_feature_server_owner(bot, interaction, label, member, ticket, server):
+    async def handle_feature_server_owner(bot, interaction, label, member, ticket, server, reply):
         if label == GG.UPVOTE:
             print(f"Upvote: {member} - {ticket.ticket_id}")
             await ticket.force_accept(GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have accepted {ticket.ticket_id}")
+            await reply(f"You have accepted {ticket.ticket_id}")
         elif label == GG.INFORMATION:
             print(f"Information: {member} - {ticket.ticket_id}")
             em = await ticket.get_embed(True)
@@ -98,51 +151,51 @@ class HandleTicket(commands.Cog):
         elif label == GG.SHRUG:
             print(f"Shrugged: {member} - {ticket.ticket_id}")
             await ticket.indifferent(member.id, '', GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have shown indifference for {ticket.ticket_id}")
+            await reply(f"You have shown indifference for {ticket.ticket_id}")
         elif label == GG.SUBSCRIBE:
-            await HandleTicket.subscribe(interaction, member, ticket)
+            await HandleTicket.subscribe(member, ticket, reply)
         elif label == GG.RESOLVE:
             await ticket.resolve(GG.ContextProxy(bot, interaction=interaction, message=GG.FakeAuthor(member)), server.id, "Ticket closed.")
-            await HandleTicket.send_message(member, interaction, f"You have resolved {ticket.ticket_id}")
+            await reply(f"You have resolved {ticket.ticket_id}")
             await ticket.commit()
         elif label == GG.NOTE:
             await HandleTicket.note(bot, interaction, ticket)
         else:
             await ticket.force_deny(GG.ContextProxy(bot, interaction=interaction), server.id)
-            await HandleTicket.send_message(member, interaction, f"You have denied {ticket.ticket_id}")
+            await reply(f"You have denied {ticket.ticket_id}")
             await ticket.commit()
 
     @staticmethod
-    async def handle_bug_or_support(bot, interaction, label, member, ticket, server):
+    async def handle_bug_or_support(bot, interaction, label, member, ticket, server, reply):
         if label == GG.INFORMATION:
             print(f"Information: {member} - {ticket.ticket_id}")
             em = await ticket.get_embed(True)
             await HandleTicket.send_dm(member, interaction, "", embed=em)
         elif label == GG.SUBSCRIBE:
-            await HandleTicket.subscribe(interaction, member, ticket)
+            await HandleTicket.subscribe(member, ticket, reply)
         elif label == GG.RESOLVE:
-            await HandleTicket.resolve(bot, interaction, member, ticket, server)
+            await HandleTicket.resolve(bot, interaction, member, ticket, server, reply)
         elif label == GG.NOTE:
             await HandleTicket.note(bot, interaction, ticket)
 
     @staticmethod
-    async def resolve(bot, interaction, member, ticket, server):
+    async def resolve(bot, interaction, member, ticket, server, reply):
         if await is_manager_assignee_or_creator(member.id, server.id, ticket, bot):
             await ticket.resolve(GG.ContextProxy(bot, interaction=interaction, message=GG.FakeAuthor(member)), server.id, "Ticket closed.")
             await ticket.commit()
         else:
-            await HandleTicket.send_message(member, interaction, f"You do not have permissions to resolve/close this.")
+            await reply(f"You do not have permissions to resolve/close this.")
 
     @staticmethod
-    async def subscribe(interaction, member, ticket):
+    async def subscribe(member, ticket, reply):
         if member.id in ticket.subscribers:
             await ticket.unsubscribe(member.id)
             await ticket.commit()
-            await HandleTicket.send_message(member, interaction, f"You have unsubscribed from {ticket.ticket_id}")
+            await reply(f"You have unsubscribed from {ticket.ticket_id}")
         else:
             await ticket.subscribe(member.id)
             await ticket.commit()
-            await HandleTicket.send_message(member, interaction, f"You have subscribed to {ticket.ticket_id}")
+            await reply(f"You have subscribed to {ticket.ticket_id}")
 
     @staticmethod
     async def note(bot, interaction, ticket):
@@ -158,6 +211,8 @@ class HandleTicket(commands.Cog):
 
     @staticmethod
     async def send_message(member, interaction, content, embed=None):
+        if interaction.response.is_done():
+            return
         try:
             await interaction.response.send_message(content=content, embed=embed, ephemeral=True)
         except:
@@ -166,6 +221,8 @@ class HandleTicket(commands.Cog):
 
     @staticmethod
     async def send_dm(member, interaction, content, embed=None):
+        if interaction.response.is_done():
+            return
         await interaction.response.defer()
         try:
             if member.dm_channel is None:
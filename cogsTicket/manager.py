@@ -27,8 +27,7 @@ class ManagerCommands(commands.Cog):
         await ctx.defer()
         ticket = await ticket_from_id(_id, ctx)
         if await is_manager_assignee_or_creator(ctx.interaction.user.id, ctx.guild.id, ticket, ctx.bot):
-            await ticket.resolve(ctx, ctx.guild.id, msg)
-            await ticket.commit()
+            ticket = await ticket.apply(lambda ticket: ticket.resolve(ctx, ctx.guild.id, msg))
             await ctx.respond(f"Resolved `{ticket.ticket_id}`: {ticket.title}.")
         else:
             await ctx.respond("You do not have the appropriate permissions to use this command.")
@@ -40,8 +39,7 @@ class ManagerCommands(commands.Cog):
         await ctx.defer()
         ticket = await ticket_from_id(_id, ctx)
         if await is_manager(ctx, ticket):
-            await ticket.unresolve(ctx, ctx.guild.id, msg)
-            await ticket.commit()
+            ticket = await ticket.apply(lambda ticket: ticket.unresolve(ctx, ctx.guild.id, msg))
             await ctx.respond(f"Unresolved `{ticket.ticket_id}`: {ticket.title}.")
         else:
             await ctx.respond("You do not have the appropriate permissions to use this command.")
@@ -69,8 +67,8 @@ class ManagerCommands(commands.Cog):
 
             ticket = await ticket_from_id(_id, ctx)
             new_ticket = copy.copy(ticket)
-            await ticket.resolve(ctx, ctx.guild.id, f"Reassigned as `{identifier}-{id_num}`.", False)
-            await ticket.commit()
+            new_ticket._after_commit = []
+            ticket = await ticket.apply(lambda ticket: ticket.resolve(ctx, ctx.guild.id, f"Reassigned as `{identifier}-{id_num}`.", False))
 
             new_ticket.ticket_id = f"{identifier}-{id_num}"
             msg = await self.bot.get_channel(ticket.trackerId).send(embed=await new_ticket.get_embed())
@@ -97,10 +95,13 @@ class ManagerCommands(commands.Cog):
         await ctx.defer()
         ticket = await ticket_from_id(_id, ctx)
         if await is_manager(ctx, ticket):
-            ticket.title = name
-            if ticket.github_issue and ticket.repo is not None:
-                await ticket.edit_title(f"{ticket.title}", f"{ticket.ticket_id} ")
-            await ticket.commit()
+            async def rename(ticket):
+                ticket.title = name
+                if ticket.github_issue and ticket.repo is not None:
+                    await ticket.edit_title(f"{ticket.title}", f"{ticket.ticket_id} ")
+                await ticket.commit()
+
+            ticket = await ticket.apply(rename)
             await ticket.update(ctx, ctx.interaction.guild.id)
             if ticket.thread:
                 channel = await ctx.bot.fetch_channel(ticket.thread)
@@ -120,10 +121,11 @@ class ManagerCommands(commands.Cog):
 
             await track_analytics_event("IssueCrawler", "Assign", f"{ticket.ticket_id}", f"{ctx.interaction.user.id}")
 
-            ticket.assignee = member.id
+            async def assign(ticket):
+                ticket.assignee = member.id
+                await ticket.addnote(ctx.interaction.user.id, f"Assigned {ticket.ticket_id} to {member.mention}", ctx, ctx.interaction.guild_id)
 
-            await ticket.addnote(ctx.interaction.user.id, f"Assigned {ticket.ticket_id} to {member.mention}", ctx, ctx.interaction.guild_id)
-            await ticket.commit()
+            ticket = await ticket.apply(assign)
             await ticket.update(ctx, ctx.interaction.guild_id)
             await ctx.respond(f"Assigned {ticket.ticket_id} to {member.mention}")
         else:
@@ -190,10 +192,11 @@ class ManagerCommands(commands.Cog):
         if await is_manager(ctx, ticket):
             await track_analytics_event("IssueCrawler", "Unassign", f"{ticket.ticket_id}", f"{ctx.interaction.user.id}")
 
-            ticket.assignee = None
+            async def unassign(ticket):
+                ticket.assignee = None
+                await ticket.addnote(ctx.interaction.user.id, f"Cleared assigned user from {ticket.ticket_id}", ctx, ctx.interaction.guild.id)
 
-            await ticket.addnote(ctx.interaction.user.id, f"Cleared assigned user from {ticket.ticket_id}", ctx, ctx.interaction.guild.id)
-            await ticket.commit()
+            ticket = await ticket.apply(unassign)
             await ticket.update(ctx, ctx.interaction.guild.id)
             await ctx.respond(f"Cleared assigned user of {ticket.ticket_id}.")
         else:
@@ -211,15 +214,13 @@ class ManagerCommands(commands.Cog):
             await track_analytics_event("IssueCrawler", "Merge", f"{merge.ticket_id}", f"{ctx.author.id}")
 
             if dupe is not None and merge is not None:
-                for x in dupe.attachments:
-                    await merge.add_attachment(ctx, ctx.interaction.guild.id, x, False)
-
-                await dupe.resolve(ctx, ctx.interaction.guild.id, f"Merged into {merge.ticket_id}")
-                await dupe.commit()
+                async def absorb(merge):
+                    await merge.absorb(ctx, ctx.interaction.guild.id, dupe)
+                    await merge.addnote(602779023151595546, f"Merged `{dupe.ticket_id}` into `{merge.ticket_id}`", ctx,
+                                        ctx.interaction.guild.id, True)
 
-                await merge.addnote(602779023151595546, f"Merged `{dupe.ticket_id}` into `{merge.ticket_id}`", ctx,
-                                    ctx.interaction.guild.id, True)
-                await merge.commit()
+                merge = await merge.apply(absorb)
+                dupe = await dupe.apply(lambda dupe: dupe.resolve(ctx, ctx.interaction.guild.id, f"Merged into {merge.ticket_id}"))
                 await merge.update(ctx, ctx.interaction.guild.id)
                 await ctx.respond(f"Merged `{dupe.ticket_id}` into `{merge.ticket_id}`")
             else:
@@ -0,0 +1,59 @@
+from discord import slash_command, Option
+from discord.ext import commands, tasks
+
+from models.ticket import Ticket
+
+from utils import globals as GG
+log = GG.log
+
+MODES = ["Instant", "Digest"]
+
+
+class Notifications(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.notifier = Ticket.notifier
+        self.digest_loop.start()
+
+    def cog_unload(self):
+        self.digest_loop.cancel()
+
+    @tasks.loop(minutes=5)
+    async def digest_loop(self):
+        try:
+            sent = await self.notifier.flush(self.bot)
+            if sent:
+                log.info(f"[Notifications] Sent {sent} digests.")
+        except Exception as e:
+            log.error(f"[Notifications] Digest run failed: {e}")
+
+    @digest_loop.before_loop
+    async def before_digest(self):
+        await self.bot.wait_until_ready()
+        await self.notifier.ensure_indexes()
+
+    @slash_command(name="notifications")
+    async def notifications(self, ctx,
+                            mode: Option(str, "A DM for every ticket update, or one digest every few hours?", choices=MODES, required=False),
+                            hours: Option(int, "Hours between digests.", min_value=1, max_value=168, required=False)):
+        """Shows or changes how you get notified about the tickets you are subscribed to."""
+        user = ctx.interaction.user
+        prefs = await self.notifier.get_preferences(user.id)
+        if mode is None and hours is None:
+            if prefs['digest']:
+                return await ctx.respond(f"You get a digest of your ticket updates every {prefs['interval'] // 60} hour(s).", ephemeral=True)
+            return await ctx.respond("You get a DM for every ticket update.", ephemeral=True)
+
+        digest = mode == "Digest" if mode is not None else prefs['digest'] or hours is not None
+        interval = hours * 60 if hours is not None else prefs['interval']
+        await self.notifier.set_preferences(user.id, digest, interval)
+        if digest:
+            await ctx.respond(f"You'll get a digest of your ticket updates every {interval // 60} hour(s).", ephemeral=True)
+        else:
+            await ctx.respond("You'll get a DM for every ticket update again.", ephemeral=True)
+            await self.notifier.flush(self.bot, [user.id])  # whatever was still buffered
+
+
+def setup(bot):
+    log.info("[Ticket] Notifications...")
+    bot.add_cog(Notifications(bot))
@@ -3,10 +3,11 @@ from discord import slash_command, Option, permissions
 from discord.ext import commands
 
 from cogsTicket.handle import HandleTicket
+from models.ticket import Ticket
 from crawler_utilities.cogs.stats import track_analytics_event
 from crawler_utilities.utils.embeds import EmbedWithRandomColor
 from utils.autocomplete import get_server_tickets, get_server_feature_identifiers
-from utils.ticketglobals import ticket_from_id, get_all_tickets
+from utils.ticketglobals import ticket_from_id
 
 from utils import globals as GG
 log = GG.log
@@ -36,11 +37,10 @@ class TicketCommands(commands.Cog):
         ticket = await ticket_from_id(_id, ctx)
         user = ctx.interaction.user
         guild_id = ctx.interaction.guild_id
-        await ticket.upvote(user.id, msg, ctx, guild_id)
-        await ticket.commit()
+        ticket = await ticket.apply(lambda ticket: ticket.upvote(user.id, msg, ctx, guild_id))
         await ctx.respond(f"Added your upvote to `{ticket.ticket_id}` - {ticket.title}.", ephemeral=True)
         await track_analytics_event("IssueCrawler", "Upvote", f"{ticket.ticket_id}", f"{user.id}")
-        await ticket.update(ctx, guild_id)
+        await ticket.schedule_update(ctx, guild_id)
 
     @slash_command(name="downvote")
     @permissions.guild_only()
@@ -49,11 +49,10 @@ class TicketCommands(commands.Cog):
         ticket = await ticket_from_id(_id, ctx)
         user = ctx.interaction.user
         guild_id = ctx.interaction.guild_id
-        await ticket.downvote(user.id, msg, ctx, guild_id)
-        await ticket.commit()
+        ticket = await ticket.apply(lambda ticket: ticket.downvote(user.id, msg, ctx, guild_id))
         await ctx.respond(f"Added your downvote to `{ticket.ticket_id}` - {ticket.title}.", ephemeral=True)
         await track_analytics_event("IssueCrawler", "Downvote", f"{ticket.ticket_id}", f"{user.id}")
-        await ticket.update(ctx, guild_id)
+        await ticket.schedule_update(ctx, guild_id)
 
     @slash_command(name="indifferent")
     @permissions.guild_only()
@@ -62,11 +61,10 @@ class TicketCommands(commands.Cog):
         ticket = await ticket_from_id(_id, ctx)
         user = ctx.interaction.user
         guild_id = ctx.interaction.guild_id
-        await ticket.indifferent(user.id, msg, ctx, guild_id)
-        await ticket.commit()
+        ticket = await ticket.apply(lambda ticket: ticket.indifferent(user.id, msg, ctx, guild_id))
         await ctx.respond(f"Added your indifference to `{ticket.ticket_id}` - {ticket.title}.", ephemeral=True)
         await track_analytics_event("IssueCrawler", "Indifference", f"{ticket.ticket_id}", f"{user.id}")
-        await ticket.update(ctx, guild_id)
+        await ticket.schedule_update(ctx, guild_id)
 
     @slash_command(name="note")
     @permissions.guild_only()
@@ -81,15 +79,22 @@ class TicketCommands(commands.Cog):
         """Subscribes (or unsubscribe) to a ticket."""
         ticket = await ticket_from_id(_id, ctx)
         user = ctx.interaction.user
-        if user.id in ticket.subscribers:
-            await ticket.unsubscribe(user.id)
+        unsubscribe = user.id in ticket.subscribers
+
+        async def toggle(ticket):
+            if unsubscribe:
+                await ticket.unsubscribe(user.id)
+            else:
+                await ticket.subscribe(user.id)
+            await ticket.commit()
+
+        ticket = await ticket.apply(toggle)
+        if unsubscribe:
             await ctx.respond(f"Unsubscribed from `{ticket.ticket_id}` - {ticket.title}.", ephemeral=True)
             await track_analytics_event("IssueCrawler", "Unsubscribe", f"{ticket.ticket_id}", f"{user.id}")
         else:
-            await ticket.subscribe(user.id)
             await ctx.respond(f"Subscribed to `{ticket.ticket_id}` - {ticket.title}.", ephemeral=True)
             await track_analytics_event("IssueCrawler", "Subscribe", f"{ticket.ticket_id}", f"{user.id}")
-        await ticket.commit()
 
     @slash_command(name="subscriptions")
     @permissions.guild_only()
@@ -139,17 +144,15 @@ class TicketCommands(commands.Cog):
     @permissions.guild_only()
     async def unsuball(self, ctx):
         """Unsubscribes from all tickets."""
-        tickets = get_all_tickets()
-        num_unsubbed = 0
-        collection = GG.MDB['Tickets']
-
         user = ctx.interaction.user
-
-        for ticket in tickets:
-            if user.id in ticket.get('subscribers', []):
-                ticket['subscribers'].remove(user.id)
-                num_unsubbed += 1
-                await collection.replace_one({"ticket_id": ticket['ticket_id']}, ticket)
+        query = {"subscribers": user.id}
+        ticket_ids = [t['ticket_id'] async for t in Ticket.collection.find(query, {"ticket_id": 1})]
+
+        # a pull that bumps the version, so a ticket committed concurrently from an older copy conflicts and retries
+        result = await Ticket.collection.update_many(query, {"$pull": {"subscribers": user.id}, "$inc": {"version": 1}})
+        num_unsubbed = result.modified_count
+        for ticket_id in ticket_ids:
+            Ticket.cache.invalidate(ticket_id)
 
         await ctx.respond(f"Unsubscribed from {num_unsubbed} tickets.", ephemeral=True)
 
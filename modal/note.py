@@ -39,7 +39,9 @@ class Note(Modal):
         embed.description = f"{description}** **"
         embed.set_footer(text=f"Added by {self.author.name}")
 
-        await self.ticket.addnote(self.author.id, description, self.ctx, self.interaction.guild_id)
+        # the modal may have been open for a while, a vote in the meantime makes the first commit conflict
+        self.ticket = await self.ticket.apply(
+            lambda ticket: ticket.addnote(self.author.id, description, self.ctx, self.interaction.guild_id))
 
         await finish_note_creation(self, interaction, embed)
 
@@ -1,4 +1,6 @@
 class Attachment:
+    __slots__ = ('author', 'message', 'veri')
+
     def __init__(self, author, message: str = '', veri: int = 0):
         self.author = author
         self.message = message or None
@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+import time
+
+import jwt
+from cachetools import TTLCache
+
+from utils import globals as GG
+
+log = GG.log
+
+TOKEN_REFRESH_MARGIN = 300  # mint a new installation token when the old one has less than five minutes left
+MISS_TTL = 60  # an installation lookup that failed for another reason than a 404 is asked again after a minute
+
+
+class GitHubApp:
+    """
+    Authenticates as a GitHub App: signs app JWTs, finds the installation of every org (or user) and mints
+    installation tokens for it. Tokens are cached and replaced shortly before they expire. Every installation
+    gets its own rate limit, so the budget grows with the number of orgs the app is installed on.
+    """
+
+    def __init__(self, app_id, private_key):
+        self.app_id = app_id
+        self.private_key = private_key.replace("\\n", "\n")
+        self.rest = None
+        self.installations = TTLCache(maxsize=500, ttl=3600)
+        self.failures = TTLCache(maxsize=500, ttl=MISS_TTL)
+        self.login = None
+        self.tokens = {}
+        self.locks = {}
+
+    def bind(self, rest):
+        self.rest = rest
+
+    def jwt(self):
+        now = int(time.time())
+        payload = {"iat": now - 60, "exp": now + 540, "iss": str(self.app_id)}
+        return jwt.encode(payload, self.private_key, algorithm="RS256")
+
+    async def app_request(self, method, path):
+        headers = {"Authorization": f"Bearer {self.jwt()}"}
+        async with self.rest.session.request(method, self.rest.url(path), headers=headers) as resp:
+            data = await resp.json(content_type=None)
+            return resp.status, data
+
+    async def installation(self, owner):
+        """The installation id of the app on ``owner``, or None when the app isn't installed there."""
+        if owner in self.installations:
+            return self.installations[owner]
+        if owner in self.failures:
+            return None
+        for kind in ("orgs", "users"):
+            status, data = await self.app_request("GET", f"/{kind}/{owner}/installation")
+            if status == 200:
+                self.installations[owner] = data['id']
+                return data['id']
+            if status != 404:  # a bad key, an outage or a rate limit says nothing about the installation
+                log.error(f"Could not look up the GitHub App installation on {owner}: {status} {data}")
+                self.failures[owner] = True
+                return None
+        log.info(f"The GitHub App is not installed on {owner}, using the token instead.")
+        self.installations[owner] = None
+        return None
+
+    async def bot_login(self):
+        """The login the app comments as, ``<slug>[bot]``; None while ``GET /app`` fails."""
+        if self.login is None:
+            status, data = await self.app_request("GET", "/app")
+            if status == 200:
+                self.login = f"{data['slug']}[bot]"
+            else:
+                log.error(f"Could not look up the GitHub App: {status} {data}")
+        return self.login
+
+    async def token(self, owner):
+        """Returns ``(installation, token)`` for the owner of a repository, or ``(None, None)``."""
+        installation = await self.installation(owner)
+        if installation is None:
+            return None, None
+        cached = self.tokens.get(installation)
+        if cached is not None and cached[1] - time.time() > TOKEN_REFRESH_MARGIN:
+            return installation, cached[0]
+
+        lock = self.locks.setdefault(installation, asyncio.Lock())
+        async with lock:
+            cached = self.tokens.get(installation)
+            if cached is not None and cached[1] - time.time() > TOKEN_REFRESH_MARGIN:
+                return installation, cached[0]
+            status, data = await self.app_request("POST", f"/app/installations/{installation}/access_tokens")
+            if status != 201:
+                log.error(f"Could not mint an installation token for {owner}: {status} {data}")
+                return None, None
+            expires = datetime.datetime.strptime(data['expires_at'], "%Y-%m-%dT%H:%M:%SZ")
+            expires = expires.replace(tzinfo=datetime.timezone.utc).timestamp()
+            self.tokens[installation] = (data['token'], expires)
+            log.info(f"Minted a GitHub App token for {owner}, valid until {data['expires_at']}.")
+            return installation, data['token']
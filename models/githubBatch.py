@@ -0,0 +1,120 @@
+from models.githubRest import GitHubException
+from models.githubScheduler import HIGH, NORMAL
+from utils import globals as GG
+
+log = GG.log
+
+ISSUE_IDS_QUERY = """
+query($owner: String!, $name: String!, $number: Int!) {
+  repository(owner: $owner, name: $name) {
+    issue(number: $number) { id }
+    labels(first: 100) { nodes { id name } }
+  }
+}
+"""
+
+GRAPHQL_STATE = {"open": "OPEN", "closed": "CLOSED"}
+
+
+class IssueBatch:
+    """
+    Collects several changes to one issue and sends them together.
+    Adjacent title/label/state changes are merged into one edit. With ``GITHUB_GRAPHQL`` enabled the whole batch
+    goes out as one GraphQL mutation, otherwise every merged step is one REST call.
+    """
+
+    def __init__(self, client, repo, issue_num, node_id=None):
+        self.client = client
+        self.repo = repo
+        self.issue_num = int(issue_num)
+        self.node_id = node_id
+        self.ops = []
+
+    def rename(self, title):
+        self.ops.append(("title", title))
+        return self
+
+    def comment(self, body):
+        self.ops.append(("comment", body))
+        return self
+
+    def label(self, labels):
+        self.ops.append(("labels", list(labels)))
+        return self
+
+    def close(self):
+        self.ops.append(("state", "closed"))
+        return self
+
+    def reopen(self):
+        self.ops.append(("state", "open"))
+        return self
+
+    def steps(self):
+        """Merges the queued operations into ``("edit", fields)`` and ``("comment", body)`` steps, keeping their order."""
+        steps = []
+        for op, value in self.ops:
+            if op == "comment":
+                steps.append(("comment", value))
+            elif steps and steps[-1][0] == "edit" and op not in steps[-1][1]:
+                steps[-1][1][op] = value
+            else:
+                steps.append(("edit", {op: value}))
+        return steps
+
+    @property
+    def priority(self):
+        return HIGH if any(op == "state" for op, _ in self.ops) else NORMAL
+
+    async def execute(self):
+        if not self.ops:
+            return
+        if GG.GITHUB_GRAPHQL:
+            try:
+                return await self.execute_graphql()
+            except UnknownLabel as e:
+                log.info(f"Label {e.message} is not on {self.repo} yet, sending the batch over REST.")
+        await self.execute_rest()
+
+    async def execute_rest(self):
+        for step, value in self.steps():
+            if step == "comment":
+                await self.client.add_issue_comment(self.repo, self.issue_num, value)
+            else:
+                await self.client.edit_issue(self.repo, self.issue_num, self.priority, **value)
+
+    async def execute_graphql(self):
+        issue_id, labels = await self.client.issue_ids(self.repo, self.issue_num, self.node_id)
+        fields = []
+        variables = {"issue": issue_id}
+        declarations = ["$issue: ID!"]
+        for i, (step, value) in enumerate(self.steps()):
+            if step == "comment":
+                declarations.append(f"$body{i}: String!")
+                variables[f"body{i}"] = value
+                fields.append(f"m{i}: addComment(input: {{subjectId: $issue, body: $body{i}}}) {{ clientMutationId }}")
+                continue
+            update = ["id: $issue"]
+            if "title" in value:
+                declarations.append(f"$title{i}: String!")
+                variables[f"title{i}"] = value['title']
+                update.append(f"title: $title{i}")
+            if "labels" in value:
+                missing = [name for name in value['labels'] if name not in labels]
+                if missing:
+                    raise UnknownLabel(missing[0])
+                declarations.append(f"$labels{i}: [ID!]!")
+                variables[f"labels{i}"] = [labels[name] for name in value['labels']]
+                update.append(f"labelIds: $labels{i}")
+            if "state" in value:
+                update.append(f"state: {GRAPHQL_STATE[value['state']]}")
+            fields.append(f"m{i}: updateIssue(input: {{{', '.join(update)}}}) {{ clientMutationId }}")
+
+        query = f"mutation({', '.join(declarations)}) {{\n  " + "\n  ".join(fields) + "\n}"
+        await self.client.client.graphql(query, variables, self.priority, self.repo.split("/")[0])
+        self.client.issues.pop((self.repo, self.issue_num), None)
+
+
+class UnknownLabel(GitHubException):
+    def __init__(self, label):
+        super().__init__(422, label)
@@ -0,0 +1,60 @@
+from cachetools import LRUCache
+
+
+class ConditionalCache:
+    """
+    Remembers GET responses together with their ``ETag``/``Last-Modified`` validators, so they can be
+    revalidated with ``If-None-Match``/``If-Modified-Since``. A 304 from GitHub does not count against the
+    rate limit. Memory is bounded by the size of the cached bodies; the least recently used ones go first.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.entries = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: entry['size'])
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+
+    @staticmethod
+    def key(url, params=None):
+        if not params:
+            return url
+        return f"{url}?{'&'.join(f'{k}={v}' for k, v in sorted(params.items()))}"
+
+    def validators(self, key):
+        """Headers that turn the request for ``key`` into a conditional one."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return {}
+        if entry['etag']:
+            return {"If-None-Match": entry['etag']}
+        return {"If-Modified-Since": entry['last_modified']}
+
+    def revalidated(self, key):
+        """GitHub answered 304: returns the stored entry."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+    def store(self, key, headers, data, size):
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self.uncached += 1
+            return
+        self.misses += 1
+        if size > self.entries.maxsize:
+            return
+        self.entries[key] = {
+            "etag": etag, "last_modified": last_modified, "link": headers.get("Link"), "data": data, "size": size
+        }
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "uncached": self.uncached, "entries": len(self.entries),
+            "bytes": self.entries.currsize, "hit_rate": self.hits / lookups if lookups else 0
+        }
@@ -1,32 +1,45 @@
 import asyncio
 
-from github import Github
-from github.Repository import Repository
+from cachetools import TTLCache, LRUCache
+
+from models.githubApp import GitHubApp
+from models.githubBatch import IssueBatch, ISSUE_IDS_QUERY
+from models.githubCoalescer import IssueBodyCoalescer
+from models.githubRest import GitHubRest, GitHubException
+from models.githubScheduler import HIGH, NORMAL, LOW
 from utils import globals as GG
 
 log = GG.log
 
 
+def repo_name(repo):
+    if isinstance(repo, dict):
+        return repo['full_name']
+    return repo
+
+
 class GitHubClient:
     _instance = None
 
     def __init__(self, access_token, orgList):
-        self.client = Github(access_token)
-        self.repos = {}
+        app = None
+        if GG.GITHUB_APP_ID and GG.GITHUB_APP_PRIVATE_KEY:
+            app = GitHubApp(GG.GITHUB_APP_ID, GG.GITHUB_APP_PRIVATE_KEY)
+        self.client = GitHubRest(access_token, GG.GITHUB_API_URL, app=app)
+        self.repos = TTLCache(maxsize=1000, ttl=3600)
+        self.prefetch_task = None
+        self.orgs = list(dict.fromkeys(x for x in orgList if x is not None))
+        self.issues = TTLCache(maxsize=500, ttl=60)
+        self.node_ids = LRUCache(maxsize=5000)
+        self.labels = TTLCache(maxsize=200, ttl=3600)
+        self.bodies = IssueBodyCoalescer(self, GG.GITHUB_BODY_WINDOW)
+        self.logins = {}
 
         self.bug_project = None
         self.feature_project = None
 
-        for x in orgList:
-            if x is not None:
-                org = self.client.get_organization(x)
-                for repo in org.get_repos("public"):  # build a method to access our repos
-                    self.repos[repo.full_name] = repo
-                for repo in org.get_repos("private"):  # build a method to access our repos
-                    self.repos[repo.full_name] = repo
-
     @classmethod
-    def initialize(cls, access_token, org=None):
+    async def initialize(cls, access_token, org=None, prefetch=False):
         log.info("Initializing Github connection...")
         if org is None:
             orgList = ["lorddusk"]
@@ -34,8 +47,11 @@ class GitHubClient:
             orgList = org
         if cls._instance:
             log.info("Using old instance of the Github connection...")
+            cls._instance.orgs = list(dict.fromkeys(x for x in orgList if x is not None))
             return cls._instance
         inst = cls(access_token, orgList)
+        if prefetch:
+            inst.prefetch_repos()
         cls._instance = inst
         log.info("Initialized Github connection...")
         return inst
@@ -46,92 +62,134 @@ class GitHubClient:
             raise RuntimeError("Client not initialized")
         return cls._instance
 
-    def get_repo(self, repo):
-        return self.repos.get(repo, None)
+    def rate_limit(self):
+        return self.client.stats()
+
+    def coalesced_bodies(self):
+        return self.bodies.stats()
+
+    def conditional_cache(self):
+        return self.client.cache.stats()
+
+    async def own_logins(self):
+        """
+        The logins this bot comments as on GitHub: the user of the token and, with an app, the app's bot user.
+        Each is asked once; one that could not be looked up is asked again next time.
+        """
+        if "token" not in self.logins:
+            try:
+                self.logins["token"] = (await self.client.get("/user", priority=LOW))['login']
+            except GitHubException as e:
+                log.error(f"Could not look up the user of the GitHub token: {e}")
+        if self.client.app is not None and "app" not in self.logins:
+            login = await self.client.app.bot_login()
+            if login is not None:
+                self.logins["app"] = login
+        return set(self.logins.values())
+
+    async def load_repos(self):
+        for org in self.orgs:
+            try:
+                async for repo in self.client.paginate(f"/orgs/{org}/repos", {"type": "all"}):
+                    self.repos[repo['full_name']] = repo
+            except GitHubException as e:
+                log.error(f"Could not list the repositories of {org}: {e}")
+
+    def prefetch_repos(self):
+        """Warms the repository cache in the background, so startup does not wait on it."""
+        if self.prefetch_task is None or self.prefetch_task.done():
+            self.prefetch_task = asyncio.get_event_loop().create_task(self.load_repos())
+        return self.prefetch_task
+
+    async def get_repo(self, repo):
+        """Resolves a repository by its full name, asking GitHub only when it isn't cached (anymore)."""
+        if repo in self.repos:
+            return self.repos[repo]
+        try:
+            data = await self.client.get(f"/repos/{repo}", priority=LOW)
+        except GitHubException:
+            return None
+        self.repos[data['full_name']] = data
+        return data
+
+    async def get_issue(self, repo, issue_num, cached=False):
+        """Fetches an issue. With ``cached`` a copy younger than the cache TTL is returned without a request."""
+        key = (repo_name(repo), int(issue_num))
+        if cached and key in self.issues:
+            return self.issues[key]
+        issue = await self.client.get(f"/repos/{key[0]}/issues/{key[1]}")
+        self.issues[key] = issue
+        return issue
+
+    async def edit_issue(self, repo, issue_num, priority=NORMAL, **fields):
+        """PATCHes the issue straight from its repo and number, no GET needed."""
+        key = (repo_name(repo), int(issue_num))
+        issue = await self.client.patch(f"/repos/{key[0]}/issues/{key[1]}", fields, priority)
+        self.issues[key] = issue
+        return issue
+
+    def batch(self, repo, issue_num, node_id=None):
+        """Starts an IssueBatch, so several changes to one issue cost one round trip."""
+        return IssueBatch(self, repo_name(repo), issue_num, node_id)
+
+    async def issue_ids(self, repo, issue_num, node_id=None):
+        """Returns the GraphQL node id of an issue and the label name -> node id map of its repository."""
+        key = (repo_name(repo), int(issue_num))
+        if node_id is not None:
+            self.node_ids[key] = node_id
+        elif key in self.issues:
+            self.node_ids[key] = self.issues[key]['node_id']
+        if key in self.node_ids and key[0] in self.labels:
+            return self.node_ids[key], self.labels[key[0]]
+
+        owner, name = key[0].split("/", 1)
+        data = await self.client.graphql(ISSUE_IDS_QUERY, {"owner": owner, "name": name, "number": key[1]}, owner=owner)
+        repository = data['repository']
+        self.node_ids[key] = repository['issue']['id']
+        self.labels[key[0]] = {label['name']: label['id'] for label in repository['labels']['nodes']}
+        return self.node_ids[key], self.labels[key[0]]
 
     async def create_issue(self, repo, title, description, labels=None):
         if labels is None:
             labels = []
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            return repo.create_issue(title, description, labels=labels)
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        issue = await self.client.post(f"/repos/{repo_name(repo)}/issues",
+                                       {"title": title, "body": description, "labels": labels}, HIGH)
+        self.issues[(repo_name(repo), issue['number'])] = issue
+        return issue
 
     async def add_issue_comment(self, repo, issue_num, description):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            return issue.create_comment(description)
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        return await self.client.post(f"/repos/{repo_name(repo)}/issues/{issue_num}/comments", {"body": description})
 
     async def label_issue(self, repo, issue_num, labels):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            issue.edit(labels=labels)
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        await self.edit_issue(repo, issue_num, labels=labels)
 
     async def close_issue(self, repo, issue_num, comment=None):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            if comment:
-                issue.create_comment(comment)
-            issue.edit(state="closed")
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        if comment:
+            await self.add_issue_comment(repo, issue_num, comment)
+        await self.edit_issue(repo, issue_num, HIGH, state="closed")
 
     async def open_issue(self, repo, issue_num, comment=None):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            if comment:
-                issue.create_comment(comment)
-            issue.edit(state="open")
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        if comment:
+            await self.add_issue_comment(repo, issue_num, comment)
+        await self.edit_issue(repo, issue_num, HIGH, state="open")
 
     async def rename_issue(self, repo, issue_num, new_title):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            issue.edit(title=new_title)
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        await self.edit_issue(repo, issue_num, title=new_title)
 
     async def edit_issue_body(self, repo, issue_num, new_body):
-        if not isinstance(repo, Repository):
-            repo = self.get_repo(repo)
-
-        def _():
-            issue = repo.get_issue(issue_num)
-            issue.edit(body=new_body)
+        await self.edit_issue(repo, issue_num, LOW, body=new_body)
 
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+    def queue_issue_body(self, repo, issue_num, new_body):
+        """Like edit_issue_body, but folded together with the other body edits of the issue in the same window."""
+        return self.bodies.submit(repo_name(repo), issue_num, new_body)
 
     async def add_issue_to_project(self, issue_num, is_bug):
+        if is_bug:
+            project = self.bug_project
+        else:
+            project = self.feature_project
 
-        def _():
-            if is_bug:
-                first_col = self.bug_project.get_columns()[0]
-            else:
-                first_col = self.feature_project.get_columns()[0]
-
-            first_col.create_card(content_id=issue_num, content_type="Issue")
-
-        return await asyncio.get_event_loop().run_in_executor(None, _)
+        columns = await self.client.get(f"/projects/{project}/columns")
+        first_col = columns[0]
+        await self.client.post(f"/projects/columns/{first_col['id']}/cards",
+                               {"content_id": issue_num, "content_type": "Issue"})
@@ -0,0 +1,72 @@
+import asyncio
+
+from utils import globals as GG
+
+log = GG.log
+
+
+class IssueBodyCoalescer:
+    """
+    Folds issue body rewrites that arrive within ``window`` seconds of each other into one PATCH.
+    A body can be passed as a string, or as a coroutine function that renders it; only the latest one
+    submitted for an issue is rendered and sent when the window closes. ``submit`` returns a future that
+    resolves once the body it was folded into has been written.
+    """
+
+    def __init__(self, client, window=10):
+        self.client = client
+        self.window = window
+        self.pending = {}
+        self.waiters = {}
+        self.tasks = {}
+        self.requested = 0
+        self.written = 0
+        self.failed = 0
+
+    def submit(self, repo, issue_num, body):
+        key = (repo, int(issue_num))
+        self.requested += 1
+        self.pending[key] = body
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(key, []).append(future)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.get_event_loop().create_task(self.run(key))
+        return future
+
+    async def run(self, key):
+        try:
+            while key in self.pending:
+                await asyncio.sleep(self.window)
+                await self.flush(key)
+        finally:
+            self.tasks.pop(key, None)
+
+    async def flush(self, key):
+        body = self.pending.pop(key, None)
+        waiters = self.waiters.pop(key, [])
+        if body is None:
+            return
+        try:
+            if callable(body):
+                body = await body()
+            await self.client.edit_issue_body(key[0], key[1], body)
+            self.written += 1
+        except Exception as e:
+            self.failed += 1
+            log.error(f"Could not update the body of {key[0]}#{key[1]}: {e}")
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    async def flush_all(self):
+        await asyncio.gather(*[self.flush(key) for key in list(self.pending)])
+
+    def stats(self):
+        return {
+            "requested": self.requested, "written": self.written, "failed": self.failed,
+            "pending": len(self.pending), "saved": self.requested - self.written - self.failed - len(self.pending)
+        }
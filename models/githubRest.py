@@ -0,0 +1,182 @@
+import re
+from json import loads
+
+import aiohttp
+from multidict import CIMultiDict
+
+from crawler_utilities.handlers.errors import CrawlerException
+
+from models.githubCache import ConditionalCache
+from models.githubScheduler import GitHubScheduler, NORMAL, LOW
+from utils import globals as GG
+
+log = GG.log
+
+GITHUB_API = "https://api.github.com"
+GITHUB_ACCEPT = "application/vnd.github+json"
+GITHUB_API_VERSION = "2022-11-28"
+OWNER_PATTERN = re.compile(r"/(?:repos|orgs|users)/([^/?]+)")
+
+
+class GitHubRest:
+    """
+    Thin asyncio wrapper around the GitHub REST API.
+    All requests share one aiohttp session, so connections to GitHub are pooled and kept alive.
+    With a GitHubApp, requests for an owner the app is installed on use that installation's token and
+    rate limit; everything else falls back to the access token.
+    """
+
+    def __init__(self, access_token, base_url=GITHUB_API, pool_size=100, timeout=30, scheduler=None, retries=3,
+                 cache=None, app=None):
+        self.access_token = access_token
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.scheduler = scheduler or GitHubScheduler()
+        self.schedulers = {}
+        self.retries = retries
+        self.cache = cache or ConditionalCache()
+        self.app = app
+        if app is not None:
+            app.bind(self)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+            headers = {
+                "Accept": GITHUB_ACCEPT,
+                "X-GitHub-Api-Version": GITHUB_API_VERSION,
+                "User-Agent": "IssueCrawler"
+            }
+            if self.access_token:
+                headers["Authorization"] = f"token {self.access_token}"
+            self._session = aiohttp.ClientSession(connector=connector, headers=headers,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def url(self, path):
+        if path.startswith("http"):
+            return path
+        return f"{self.base_url}{path}"
+
+    async def authorize(self, url, owner=None):
+        """Returns the Authorization header override and the scheduler to use for a request."""
+        if self.app is None:
+            return {}, self.scheduler
+        if owner is None:
+            match = OWNER_PATTERN.search(url[len(self.base_url):] if url.startswith(self.base_url) else url)
+            owner = match.group(1) if match else None
+        if owner is None:
+            return {}, self.scheduler
+        installation, token = await self.app.token(owner)
+        if installation is None:
+            return {}, self.scheduler
+        if installation not in self.schedulers:
+            self.schedulers[installation] = GitHubScheduler()
+        return {"Authorization": f"token {token}"}, self.schedulers[installation]
+
+    def stats(self):
+        stats = {"default": self.scheduler.stats()}
+        for installation, scheduler in self.schedulers.items():
+            stats[installation] = scheduler.stats()
+        return stats
+
+    async def send(self, method, path, json=None, params=None, priority=NORMAL, owner=None):
+        """
+        Sends a request once the scheduler allows it and returns a ``(status, headers, data)`` tuple.
+        GETs are revalidated against the conditional cache, a 304 is answered from it.
+        Rate limited requests are retried after the limit resets (low priority ones until they get through),
+        any other 4xx/5xx raises.
+        """
+        url = self.url(path)
+        key = self.cache.key(url, params) if method == "GET" else None
+        attempt = 0
+        while True:
+            headers, scheduler = await self.authorize(url, owner)
+            await scheduler.acquire(priority)
+            if key is not None:
+                headers.update(self.cache.validators(key))
+            async with self.session.request(method, url, json=json, params=params, headers=headers) as resp:
+                scheduler.update(resp.status, resp.headers)
+                body = await resp.read()
+            if resp.status == 304 and key is not None:
+                scheduler.refund()
+                entry = self.cache.revalidated(key)
+                if entry is None:  # evicted while the request was out, ask again without validators
+                    continue
+                headers = CIMultiDict(resp.headers)
+                if entry['link']:
+                    headers['Link'] = entry['link']
+                return 200, headers, entry['data']
+            data = loads(body) if body else None
+            if resp.status >= 400:
+                if scheduler.is_rate_limited(resp.status, resp.headers) and (priority == LOW or attempt < self.retries):
+                    attempt += 1
+                    continue
+                message = data.get('message', '') if isinstance(data, dict) else data
+                raise GitHubException(resp.status, message)
+            if key is not None:
+                self.cache.store(key, resp.headers, data, len(body))
+            else:
+                self.cache.invalidate(url)
+            return resp.status, resp.headers, data
+
+    async def request(self, method, path, json=None, params=None, priority=NORMAL, owner=None):
+        _, _, data = await self.send(method, path, json=json, params=params, priority=priority, owner=owner)
+        return data
+
+    async def get(self, path, params=None, priority=NORMAL):
+        return await self.request("GET", path, params=params, priority=priority)
+
+    async def post(self, path, json=None, priority=NORMAL):
+        return await self.request("POST", path, json=json, priority=priority)
+
+    async def patch(self, path, json=None, priority=NORMAL):
+        return await self.request("PATCH", path, json=json, priority=priority)
+
+    async def graphql(self, query, variables=None, priority=NORMAL, owner=None):
+        """Runs a GraphQL query or mutation; errors in the response body raise like failed REST calls."""
+        data = await self.request("POST", "/graphql", {"query": query, "variables": variables or {}},
+                                  priority=priority, owner=owner)
+        errors = data.get('errors') if isinstance(data, dict) else None
+        if errors:
+            status = 403 if any(error.get('type') == "RATE_LIMITED" for error in errors) else 422
+            raise GitHubException(status, "; ".join(error.get('message', '') for error in errors))
+        return data['data']
+
+    async def paginate(self, path, params=None, per_page=100, priority=LOW):
+        """Yields every item of a paginated list endpoint, following the ``Link: rel="next"`` header."""
+        params = dict(params or {})
+        params.setdefault("per_page", per_page)
+        url = path
+        while url is not None:
+            _, headers, data = await self.send("GET", url, params=params, priority=priority)
+            for item in data or []:
+                yield item
+            url = next_link(headers)
+            params = None  # the next link already carries the query string
+
+
+def next_link(headers):
+    link = headers.get("Link", "")
+    for part in link.split(","):
+        section = part.split(";")
+        if len(section) < 2:
+            continue
+        if section[1].strip() == 'rel="next"':
+            return section[0].strip()[1:-1]
+    return None
+
+
+class GitHubException(CrawlerException):
+    def __init__(self, status, message=""):
+        super().__init__(f"GitHub returned {status}: {message}")
+        self.status = status
+        self.message = message
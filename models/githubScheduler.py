@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from utils import globals as GG
+
+log = GG.log
+
+HIGH = 0  # user visible work: creating, closing and reopening issues
+NORMAL = 1  # comments, labels, titles and reads
+LOW = 2  # cosmetic work such as re-rendering an issue body
+
+# Requests of a priority are held back once GitHub reports this many (or fewer) requests left in the window.
+RESERVE = {HIGH: 0, NORMAL: 100, LOW: 500}
+
+
+class GitHubScheduler:
+    """
+    Hands out permission to call GitHub, highest priority first.
+    A token bucket smooths bursts over the hourly quota, and the ``X-RateLimit-*`` headers of every
+    response keep track of what GitHub says is left. Work that may not run yet is delayed, never failed.
+    """
+
+    def __init__(self, hourly_limit=5000, burst=50, reserve=None):
+        self.rate = hourly_limit / 3600
+        self.burst = burst
+        self.reserve = reserve or RESERVE
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+        self.limit = hourly_limit
+        self.remaining = None
+        self.reset = 0
+        self.blocked_until = 0
+
+        self.waiters = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.granted = {HIGH: 0, NORMAL: 0, LOW: 0}
+        self.waits = {HIGH: 0, NORMAL: 0, LOW: 0}
+
+    async def acquire(self, priority=NORMAL):
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        self.wakeup.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_event_loop().create_task(self.dispatch())
+        await future
+
+    async def dispatch(self):
+        while self.waiters:
+            priority, _, future = self.waiters[0]
+            if future.done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = self.delay(priority)
+            if delay > 0:
+                self.waits[priority] += 1
+                self.wakeup.clear()
+                try:  # a new, possibly more important, request interrupts the wait
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.waiters)
+            self.tokens -= 1
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.granted[priority] += 1
+            future.set_result(None)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, priority):
+        """Seconds a request of this priority has to wait before it may be sent."""
+        now = time.time()
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.remaining is not None and self.reset > now and self.remaining <= self.reserve.get(priority, 0):
+            return self.reset - now + 1
+        self.refill()
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def refund(self):
+        """Gives back the token of a request GitHub didn't charge for, like a 304."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def update(self, status, headers):
+        """Feeds the rate limit headers of a response back into the scheduler."""
+        if "X-RateLimit-Remaining" in headers:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset = int(headers.get("X-RateLimit-Reset", 0))
+            limit = int(headers.get("X-RateLimit-Limit", self.limit))
+            if limit != self.limit:
+                self.limit = limit
+                self.rate = limit / 3600
+        if self.is_rate_limited(status, headers):
+            if "Retry-After" in headers:
+                self.blocked_until = time.time() + int(headers["Retry-After"])
+            else:
+                self.blocked_until = max(self.reset, time.time() + 60)
+            log.info(f"GitHub rate limit hit, holding requests for {int(self.blocked_until - time.time())}s.")
+
+    @staticmethod
+    def is_rate_limited(status, headers):
+        if status not in (403, 429):
+            return False
+        return "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+
+    def stats(self):
+        return {
+            "remaining": self.remaining, "limit": self.limit, "reset": self.reset, "queued": len(self.waiters),
+            "granted": dict(self.granted), "waits": dict(self.waits)
+        }
@@ -0,0 +1,163 @@
+import asyncio
+import calendar
+import datetime
+import time
+
+from pymongo import ReturnDocument
+
+from models.attachment import Attachment
+from models.githubClient import GitHubClient
+from models.ticket import Ticket, TicketException, formatNumber, PRI_LABEL_NAMES, FEATURE_LABEL, SUPPORT_LABEL, EXEMPT_LABEL
+
+from utils import globals as GG
+
+log = GG.log
+
+PAGE = 100
+POST_INTERVAL = 1.2  # one tracker message per 1.2s stays under the 5 messages per 5 seconds channel limit
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def github_timestamp(value):
+    return calendar.timegm(datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").timetuple())
+
+
+async def reserve_ticket_nums(identifier, server, amount):
+    """Reserves ``amount`` consecutive ticket numbers in one write and returns them."""
+    counter = await GG.MDB.TicketNums.find_one_and_update({'key': identifier, 'server': server},
+                                                          {"$inc": {"amount": amount}},
+                                                          return_document=ReturnDocument.AFTER)
+    if counter is None:
+        raise TicketException(f"The bot couldn't find the `{identifier}` identifier.")
+    last = formatNumber(counter['amount'])
+    return range(last - amount + 1, last + 1)
+
+
+class IssueImporter:
+    """
+    Imports the existing issues of a repository as tickets of one identifier.
+    Issues are streamed page by page: every page gets its ticket numbers reserved in one write and is stored
+    with one ``insert_many``. Tracker messages for the open tickets are posted from a queue at a pace Discord
+    accepts. Progress lives in the ImportJobs collection, running the same import again picks up where it
+    stopped; issues that already have a ticket are skipped.
+    """
+    jobs = GG.MDB['ImportJobs']
+
+    def __init__(self, bot, repo, identifier, server_id, tracker_id, progress=None):
+        self.bot = bot
+        self.repo = repo
+        self.identifier = identifier
+        self.server_id = server_id
+        self.tracker_id = tracker_id
+        self.progress = progress
+        self.tickets = GG.MDB['Tickets']
+        self.posts = asyncio.Queue()
+        self.job = None
+
+    @property
+    def job_id(self):
+        return f"{self.server_id}:{self.identifier}:{self.repo}"
+
+    async def run(self):
+        self.job = await self.jobs.find_one_and_update(
+            {"_id": self.job_id},
+            {"$set": {"state": RUNNING, "started": time.time()},
+             "$setOnInsert": {"repo": self.repo, "identifier": self.identifier, "server": self.server_id,
+                              "tracker": self.tracker_id, "seen": 0, "imported": 0, "skipped": 0, "posted": 0,
+                              "last_issue": 0}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        poster = asyncio.get_event_loop().create_task(self.post_messages())
+        try:
+            await self.queue_unposted()
+            page = []
+            params = {"state": "all", "sort": "created", "direction": "asc"}
+            async for issue in GitHubClient.get_instance().client.paginate(f"/repos/{self.repo}/issues", params):
+                if issue['number'] <= self.job['last_issue']:
+                    continue  # imported by an earlier run of this job
+                page.append(issue)
+                if len(page) >= PAGE:
+                    await self.import_page(page)
+                    page = []
+            if page:
+                await self.import_page(page)
+            await self.posts.join()
+            await self.save(state=DONE, finished=time.time())
+        except Exception as e:
+            log.error(f"[Import] {self.job_id} stopped: {e}")
+            await self.save(state=FAILED, error=str(e))
+            raise
+        finally:
+            poster.cancel()
+        return self.job
+
+    async def import_page(self, issues):
+        issues = [i for i in issues if 'pull_request' not in i and
+                  EXEMPT_LABEL not in [label['name'] for label in i['labels']]]
+        numbers = [i['number'] for i in issues]
+        tracked = {t['github_issue'] async for t in self.tickets.find(
+            {"github_repo": self.repo, "github_issue": {"$in": numbers}}, {"github_issue": 1})}
+        new = [i for i in issues if i['number'] not in tracked]
+
+        if new:
+            ticket_nums = await reserve_ticket_nums(self.identifier, self.server_id, len(new))
+            tickets = await asyncio.gather(*(self.build(issue, num) for issue, num in zip(new, ticket_nums)))
+            await self.tickets.insert_many([ticket.to_dict() for ticket in tickets], ordered=False)
+            for ticket in tickets:
+                if ticket.is_open():
+                    self.posts.put_nowait(ticket)
+
+        self.job['seen'] += len(numbers)
+        self.job['imported'] += len(new)
+        self.job['skipped'] += len(numbers) - len(new)
+        await self.save(last_issue=max(numbers, default=self.job['last_issue']))
+
+    async def build(self, issue, ticket_num):
+        labels = [label['name'] for label in issue['labels']]
+        is_support = SUPPORT_LABEL in labels
+        ticket = await Ticket.new("GitHub", f"{self.identifier}-{ticket_num}", issue['title'],
+                                  [Attachment("GitHub", issue['body'])], is_bug=FEATURE_LABEL not in labels and not is_support,
+                                  is_support=is_support, repo=self.repo, trackerId=self.tracker_id,
+                                  server_id=self.server_id)
+        ticket.github_issue = issue['number']
+        ticket.opened = github_timestamp(issue['created_at'])
+        ticket.last_updated = int(time.time())
+        if issue['state'] == "closed":
+            ticket.severity = -1
+            ticket.closed = github_timestamp(issue['closed_at']) if issue.get('closed_at') else None
+        else:
+            ticket.severity = next((i for i, pri in enumerate(PRI_LABEL_NAMES) if any(pri in l for l in labels)), 6)
+        return ticket
+
+    async def queue_unposted(self):
+        """Queues the open tickets an interrupted run imported but never posted."""
+        query = {"github_repo": self.repo, "server_id": self.server_id, "trackerId": self.tracker_id,
+                 "ticket_id": {"$regex": f"^{self.identifier}-"}, "message": {"$in": [0, None]},
+                 "severity": {"$gte": 0}}
+        async for data in self.tickets.find(query):
+            del data['_id']
+            self.posts.put_nowait(Ticket.from_dict(data))
+
+    async def post_messages(self):
+        while True:
+            ticket = await self.posts.get()
+            try:
+                message = await ticket.setup_message(self.bot, self.server_id, self.tracker_id)
+                await self.tickets.update_one({"ticket_id": ticket.ticket_id, "server_id": self.server_id},
+                                              {"$set": {"message": message.id}})
+                self.job['posted'] += 1
+                if self.job['posted'] % PAGE == 0:
+                    await self.save()
+            except Exception as e:  # one bad message must not stall the queue
+                log.error(f"[Import] Could not post {ticket.ticket_id}: {e}")
+            finally:
+                self.posts.task_done()
+            await asyncio.sleep(POST_INTERVAL)
+
+    async def save(self, **fields):
+        self.job.update(fields)
+        await self.jobs.update_one({"_id": self.job_id}, {"$set": {k: v for k, v in self.job.items() if k != "_id"}})
+        if self.progress is not None:
+            await self.progress(self.job)
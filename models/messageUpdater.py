@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+from utils import globals as GG
+
+log = GG.log
+
+WINDOW = 1.5  # seconds updates for one message are collected before it is edited
+CHANNEL_RATE = 1.0  # edits per second per tracker channel
+CHANNEL_BURST = 4  # Discord allows 5 per 5 seconds per channel, one is left for new tracker messages
+
+
+class TokenBucket:
+    """Hands out ``rate`` tokens a second, ``burst`` at most at once; waiters are served in the order they arrived."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessageUpdater:
+    """
+    Debounces tracker message edits. Updates scheduled for a message within ``window`` seconds become one edit,
+    made with the ticket as it is when the window closes. Every tracker channel has its own token bucket, so a
+    hot ticket gets one edit per window and the other tickets in its channel still get their turn.
+    """
+
+    def __init__(self, window=WINDOW, rate=CHANNEL_RATE, burst=CHANNEL_BURST):
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.pending = {}
+        self.tasks = {}
+        self.buckets = {}
+        self.requested = 0
+        self.edits = 0
+
+    def schedule(self, message_id, channel_id, load, update):
+        """
+        Edits the message ``message_id`` in ``channel_id`` soon: ``await update(await load())``.
+        Later calls for the same message before the edit replace ``load`` and ``update``.
+        """
+        self.requested += 1
+        self.pending[message_id] = (channel_id, load, update)
+        if message_id not in self.tasks:
+            self.tasks[message_id] = asyncio.get_event_loop().create_task(self.flush(message_id))
+
+    async def flush(self, message_id):
+        try:
+            await asyncio.sleep(self.window)
+            channel_id, load, update = self.pending.pop(message_id)
+            await self.bucket(channel_id).acquire()
+            await update(await load())
+            self.edits += 1
+        except Exception as e:  # a ticket that is gone or a message that was deleted in the meantime
+            log.info(f"Could not update tracker message {message_id}: {e}")
+        finally:
+            del self.tasks[message_id]
+            if message_id in self.pending:  # scheduled again while this edit was being made
+                self.tasks[message_id] = asyncio.get_event_loop().create_task(self.flush(message_id))
+
+    def bucket(self, channel_id):
+        if channel_id not in self.buckets:
+            self.buckets[channel_id] = TokenBucket(self.rate, self.burst)
+        return self.buckets[channel_id]
+
+    def stats(self):
+        return {"requested": self.requested, "edits": self.edits, "pending": len(self.pending)}
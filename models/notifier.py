@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import discord
+from pymongo import ReturnDocument
+
+from models.messageUpdater import TokenBucket
+
+from utils import globals as GG
+
+log = GG.log
+
+CONCURRENCY = 5  # DMs in flight at once
+DM_RATE = 5.0  # DMs per second, opening a DM channel has a rate limit of its own
+DM_BURST = 5
+DIGEST_INTERVAL = 60  # minutes between digests unless the user picks something else
+DM_LIMIT = 2000
+
+
+class SubscriberNotifier:
+    """
+    Sends ticket notifications to subscribers in the background. Users are looked up in the bot's cache and only
+    fetched when they aren't in it; DMs go out concurrently, bounded by a semaphore and a token bucket.
+    Users who opted into digests get their notifications buffered in Mongo instead, ``flush`` sends each of them
+    one DM with everything buffered once their interval has passed.
+    """
+    preferences = GG.MDB['NotificationPreferences']
+    buffer = GG.MDB['NotificationDigest']
+
+    def __init__(self, concurrency=CONCURRENCY, rate=DM_RATE, burst=DM_BURST):
+        self.concurrency = concurrency
+        self.semaphore = None
+        self.bucket = TokenBucket(rate, burst)
+        self.tasks = set()
+        self.sent = 0
+        self.failed = 0
+        self.buffered = 0
+        self.digests = 0
+
+    @classmethod
+    async def ensure_indexes(cls):
+        await cls.preferences.create_index("user", unique=True)
+        await cls.preferences.create_index([("digest", 1), ("next_digest", 1)])
+        await cls.buffer.create_index([("user", 1), ("_id", 1)])
+
+    @classmethod
+    async def get_preferences(cls, user_id):
+        prefs = await cls.preferences.find_one({"user": user_id})
+        return prefs or {"user": user_id, "digest": False, "interval": DIGEST_INTERVAL}
+
+    @classmethod
+    async def set_preferences(cls, user_id, digest, interval=DIGEST_INTERVAL):
+        """Switches a user between a DM per notification and digests; switching back sends what is buffered."""
+        return await cls.preferences.find_one_and_update(
+            {"user": user_id},
+            {"$set": {"digest": digest, "interval": interval, "next_digest": time.time() + interval * 60 if digest else 0}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+
+    def notify(self, bot, user_ids, msg):
+        """Starts delivering ``msg`` to ``user_ids`` and returns right away."""
+        if not user_ids:
+            return
+        task = asyncio.get_event_loop().create_task(self.deliver(bot, user_ids, msg))
+        self.tasks.add(task)  # the loop only keeps weak references to tasks
+        task.add_done_callback(self.tasks.discard)
+
+    async def deliver(self, bot, user_ids, msg):
+        digest = {p['user'] async for p in self.preferences.find({"user": {"$in": user_ids}, "digest": True}, {"user": 1})}
+        if digest:
+            now = time.time()
+            await self.buffer.insert_many([{"user": user_id, "message": msg, "created": now} for user_id in digest])
+            self.buffered += len(digest)
+        await self.send_all(bot, [(user_id, msg) for user_id in user_ids if user_id not in digest])
+
+    async def send_all(self, bot, messages):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self.send(bot, user_id, msg) for user_id, msg in messages))
+
+    async def send(self, bot, user_id, msg):
+        async with self.semaphore:
+            await self.bucket.acquire()
+            try:
+                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+                await user.send(msg)
+                self.sent += 1
+                return True
+            except discord.HTTPException:  # DMs closed, or the user is gone
+                self.failed += 1
+                return False
+
+    async def flush(self, bot, user_ids=None):
+        """Sends the digests that are due, or those of ``user_ids`` whatever their interval; returns how many went out."""
+        now = time.time()
+        query = {"user": {"$in": user_ids}} if user_ids is not None else {"digest": True, "next_digest": {"$lte": now}}
+        due = {p['user']: p.get('interval', DIGEST_INTERVAL) async for p in self.preferences.find(query)}
+        if user_ids is not None:
+            due.update({user_id: DIGEST_INTERVAL for user_id in user_ids if user_id not in due})
+        if not due:
+            return 0
+
+        entries = {}
+        async for entry in self.buffer.find({"user": {"$in": list(due)}}).sort("_id", 1):
+            entries.setdefault(entry['user'], []).append(entry)
+        digests = [(user_id, chunk) for user_id, buffered in entries.items() for chunk in self.render(buffered)]
+        results = await self.send_all(bot, digests)
+
+        # a failed DM is dropped as well, a user with closed DMs would otherwise collect notifications forever
+        await self.buffer.delete_many({"_id": {"$in": [e['_id'] for buffered in entries.values() for e in buffered]}})
+        for user_id, interval in due.items():
+            await self.preferences.update_one({"user": user_id, "digest": True}, {"$set": {"next_digest": now + interval * 60}})
+        self.digests += sum(results)
+        return len(entries)
+
+    @staticmethod
+    def render(entries):
+        """The buffered notifications of one user as few DMs as possible."""
+        header = f"**{len(entries)} ticket update{'s' if len(entries) != 1 else ''} since your last digest:**"
+        chunks = [header]
+        for entry in entries:
+            line = f"\n- {entry['message']}"[:DM_LIMIT]
+            if len(chunks[-1]) + len(line) > DM_LIMIT:
+                chunks.append(line.lstrip("\n"))
+            else:
+                chunks[-1] += line
+        return chunks
+
+    def stats(self):
+        return {"sent": self.sent, "failed": self.failed, "deliveries": len(self.tasks), "buffered": self.buffered,
+                "digests": self.digests}
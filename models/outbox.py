@@ -0,0 +1,94 @@
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+from models.githubScheduler import HIGH, NORMAL
+from utils import globals as GG
+
+log = GG.log
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class GitHubOutbox:
+    """
+    Durable queue of GitHub mutations, stored in Mongo.
+    Tickets enqueue here and move on; the Outbox cog drains the queue in order per ticket (or issue),
+    retrying until GitHub accepts the change. Entries with a ``key`` are only ever enqueued once.
+    """
+    collection = GG.MDB['GithubOutbox']
+
+    @classmethod
+    async def ensure_indexes(cls):
+        await cls.collection.create_index("key", unique=True, sparse=True)
+        await cls.collection.create_index([("state", 1), ("_id", 1)])
+        await cls.collection.create_index([("stream", 1), ("state", 1), ("_id", 1)])
+        await cls.collection.create_index("finished", expireAfterSeconds=30 * 24 * 3600)
+
+    @classmethod
+    async def enqueue(cls, action, repo, issue=None, ticket_id=None, key=None, coalesce=False, delay=0, **payload):
+        """
+        Stores a mutation and returns its entry.
+        When ``key`` is already taken the existing entry is returned instead; with ``coalesce`` a still pending
+        entry takes over the new payload, so only the latest version is sent.
+        """
+        now = time.time()
+        entry = {
+            "action": action, "repo": repo, "issue": issue or None, "ticket_id": ticket_id,
+            "stream": ticket_id or f"{repo}#{issue}", "payload": payload, "coalesce": coalesce,
+            "state": PENDING, "attempts": 0, "next_try": now + delay, "created": now
+        }
+        if key is not None:
+            entry['key'] = key
+        try:
+            await cls.collection.insert_one(entry)
+        except DuplicateKeyError:
+            existing = await cls.collection.find_one({"key": key})
+            if coalesce and existing is not None and existing['state'] == PENDING:
+                await cls.collection.update_one({"_id": existing['_id'], "state": PENDING}, {"$set": {"payload": payload}})
+                existing['payload'] = payload
+            return existing
+        return entry
+
+    @classmethod
+    async def create_issue(cls, repo, ticket_id, title, body, labels):
+        return await cls.enqueue("create_issue", repo, ticket_id=ticket_id, key=f"create:{ticket_id}",
+                                 title=title, body=body, labels=labels)
+
+    @classmethod
+    async def comment(cls, repo, issue, body, ticket_id=None):
+        return await cls.enqueue("comment", repo, issue, ticket_id, body=body)
+
+    @classmethod
+    async def edit(cls, repo, issue, ticket_id=None, priority=NORMAL, **fields):
+        return await cls.enqueue("edit", repo, issue, ticket_id, priority=priority, fields=fields)
+
+    @classmethod
+    async def label(cls, repo, issue, labels, ticket_id=None):
+        return await cls.edit(repo, issue, ticket_id, labels=labels)
+
+    @classmethod
+    async def close(cls, repo, issue, ticket_id=None):
+        return await cls.edit(repo, issue, ticket_id, HIGH, state="closed")
+
+    @classmethod
+    async def reopen(cls, repo, issue, ticket_id=None):
+        return await cls.edit(repo, issue, ticket_id, HIGH, state="open")
+
+    @classmethod
+    async def rename(cls, repo, issue, title, ticket_id=None):
+        return await cls.edit(repo, issue, ticket_id, title=title)
+
+    @classmethod
+    async def batch(cls, repo, issue, ops, ticket_id=None, node_id=None):
+        """Several changes to one issue, sent as one IssueBatch. ``ops`` is a list of ``[op, value]`` pairs."""
+        return await cls.enqueue("batch", repo, issue, ticket_id, ops=ops, node_id=node_id)
+
+    @classmethod
+    async def sync_body(cls, repo, issue, ticket_id, server_id):
+        """Re-renders the issue body from the stored ticket when it runs, so queued syncs collapse into one."""
+        return await cls.enqueue("sync_body", repo, issue, ticket_id, key=f"body:{ticket_id}", coalesce=True,
+                                 server_id=server_id)
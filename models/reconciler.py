@@ -0,0 +1,128 @@
+import calendar
+import datetime
+
+from pymongo import UpdateOne
+
+from models.githubClient import GitHubClient
+from models.githubRest import GitHubException
+from models.ticket import Ticket, PRI_LABEL_NAMES, BUG_LABEL, SUPPORT_LABEL
+
+from utils import globals as GG
+
+log = GG.log
+
+CHUNK = 500
+
+
+def github_timestamp(value):
+    return calendar.timegm(datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").timetuple())
+
+
+def tracked_repos():
+    repos = set(GG.REPO_ID_MAP)
+    for server in GG.GITHUBSERVERS:
+        for listen in server.listen:
+            if listen.repo and listen.repo != 'NoRepo':
+                repos.add(listen.repo)
+    return sorted(repos)
+
+
+def diff(ticket, issue):
+    """The ``$set`` needed to bring a stored ticket in line with its GitHub issue, empty if they agree."""
+    changes = {}
+    labels = [label['name'] for label in issue['labels']]
+
+    if issue['state'] == "closed" and ticket['severity'] != -1:
+        changes['severity'] = -1
+        changes['closed'] = github_timestamp(issue['closed_at']) if issue.get('closed_at') else None
+    elif issue['state'] == "open" and ticket['severity'] == -1:
+        changes['severity'] = 6
+        changes['closed'] = None
+
+    if issue['state'] == "open":
+        priorities = [i for i, pri in enumerate(PRI_LABEL_NAMES) if any(pri in label for label in labels)]
+        if len(priorities) == 1 and changes.get('severity', ticket['severity']) != priorities[0]:
+            changes['severity'] = priorities[0]
+
+    title = issue['title']
+    if title.startswith(f"{ticket['ticket_id']} "):
+        title = title[len(ticket['ticket_id']) + 1:]
+    if title != ticket['title']:
+        changes['title'] = title
+
+    is_bug = BUG_LABEL in labels
+    is_support = SUPPORT_LABEL in labels
+    if labels and ticket.get('is_bug') != is_bug:
+        changes['is_bug'] = is_bug
+    if labels and ticket.get('is_support', False) != is_support:
+        changes['is_support'] = is_support
+    return changes
+
+
+class GitHubReconciler:
+    """
+    Pages through the issues of every tracked repository that changed since the last run, diffs them against
+    the Tickets collection and writes the fixes back with one bulk write per page. Each repo keeps a
+    watermark (the newest ``updated_at`` it has seen) so later runs only fetch what changed since.
+    """
+
+    def __init__(self):
+        self.tickets = GG.MDB['Tickets']
+        self.watermarks = GG.MDB['GithubSync']
+
+    async def run(self, repos=None):
+        """Reconciles the given repos (all tracked ones by default) and returns a report per repo."""
+        report = {}
+        for repo in repos or tracked_repos():
+            try:
+                report[repo] = await self.reconcile(repo)
+            except GitHubException as e:
+                log.error(f"[Reconcile] {repo} failed: {e}")
+                report[repo] = {"error": str(e)}
+        return report
+
+    async def reconcile(self, repo):
+        watermark = await self.watermarks.find_one({"repo": repo})
+        params = {"state": "all", "sort": "updated", "direction": "asc"}
+        if watermark is not None:
+            params['since'] = watermark['since']
+
+        result = {"seen": 0, "fixed": 0, "changed": []}
+        newest = watermark['since'] if watermark is not None else None
+        page = []
+        async for issue in GitHubClient.get_instance().client.paginate(f"/repos/{repo}/issues", params):
+            if 'pull_request' in issue:
+                continue
+            page.append(issue)
+            if newest is None or issue['updated_at'] > newest:
+                newest = issue['updated_at']
+            if len(page) >= CHUNK:
+                await self.apply(repo, page, result)
+                await self.save_watermark(repo, newest)
+                page = []
+        if page:
+            await self.apply(repo, page, result)
+        if newest is not None:
+            await self.save_watermark(repo, newest)
+        log.info(f"[Reconcile] {repo}: {result['seen']} issues checked, {result['fixed']} tickets fixed.")
+        return result
+
+    async def apply(self, repo, issues, result):
+        by_number = {issue['number']: issue for issue in issues}
+        result['seen'] += len(issues)
+        query = {"github_repo": repo, "github_issue": {"$in": list(by_number)}}
+        projection = {"ticket_id": 1, "title": 1, "severity": 1, "is_bug": 1, "is_support": 1, "github_issue": 1}
+        updates = []
+        async for ticket in self.tickets.find(query, projection):
+            changes = diff(ticket, by_number[ticket['github_issue']])
+            if changes:
+                updates.append(UpdateOne({"_id": ticket['_id']}, {"$set": changes, "$inc": {"version": 1}}))
+                result['changed'].append({"ticket_id": ticket['ticket_id'], "changes": changes})
+        if updates:
+            await self.tickets.bulk_write(updates, ordered=False)
+            for change in result['changed'][-len(updates):]:
+                Ticket.cache.invalidate(change['ticket_id'])
+            result['fixed'] += len(updates)
+
+    async def save_watermark(self, repo, since):
+        await self.watermarks.update_one({"repo": repo}, {"$set": {"since": since}}, upsert=True)
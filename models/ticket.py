@@ -1,9 +1,14 @@
+import asyncio
 import datetime
 import discord
+import hashlib
+import json
+import random
 import re
 from cachetools import LRUCache
 from discord import ButtonStyle
 from discord.ui import Button
+from pymongo import ReturnDocument
 
 from crawler_utilities.cogs.stats import track_analytics_event
 from crawler_utilities.handlers.errors import CrawlerException
@@ -11,8 +16,11 @@ from crawler_utilities.utils.pagination import createPaginatorWithEmbeds, pagina
 
 import utils.globals as GG
 from models.attachment import Attachment
+from models.messageUpdater import MessageUpdater
 from crawler_utilities.utils.functions import splitDiscordEmbedField
-from models.githubClient import GitHubClient
+from models.outbox import GitHubOutbox
+from models.notifier import SubscriberNotifier
+from models.ticketCache import TicketCache
 import calendar
 import time
 
@@ -26,6 +34,11 @@ PRIORITY = {
 PRIORITY_LABELS = {
     0: "P0: Critical", 1: "P1: Very High", 2: "P2: High", 3: "P3: Medium", 4: "P4: Low", 5: "P5: Trivial"
 }
+PRI_LABEL_NAMES = ("P0", "P1", "P2", "P3", "P4", "P5")
+BUG_LABEL = "bug"
+FEATURE_LABEL = "featurereq"
+SUPPORT_LABEL = "support"
+EXEMPT_LABEL = "enhancement"
 VALID_LABELS = (
     'bug', 'duplicate', 'featurereq', 'help wanted', 'invalid', 'wontfix', 'longterm', 'enhancement',
     'P0: Critical', 'P1: Very High', 'P2: High', 'P3: Medium', 'P4: Low', 'P5: Trivial', 'stale',
@@ -55,45 +68,65 @@ SHRUG_REACTION = "\U0001F937"
 INFORMATION_REACTION = "\U00002139"
 GITHUB_THRESHOLD = 5
 GITHUB_THRESHOLD_5ET = 5
-
-message_ids = {}
+VOTE_VERI = (2, -2, 3)
+REPRO_VERI = (1, -1)
+VOTE_COUNTERS = {2: 'upvotes', -2: 'downvotes', 3: 'shrugs'}
+
+# attribute -> document field of everything commit() compares against the loaded copy
+TRACKED_FIELDS = {
+    'reporter': 'reporter', 'ticket_id': 'ticket_id', 'title': 'title', 'severity': 'severity', 'message': 'message',
+    'github_issue': 'github_issue', 'repo': 'github_repo', 'subscribers': 'subscribers', 'is_bug': 'is_bug',
+    'is_support': 'is_support', 'jumpUrl': 'jumpUrl', 'trackerId': 'trackerId', 'assignee': 'assignee',
+    'milestone': 'milestone', 'opened': 'opened', 'closed': 'closed', 'thread': 'thread', 'server_id': 'server_id'
+}
+COUNTER_FIELDS = ('upvotes', 'downvotes', 'shrugs', 'verification')
+COMMIT_ATTEMPTS = 5
+MESSAGE_IDS = 10000  # tracker message id -> ticket id entries kept in memory
+CACHED_TICKETS = 2000
+CACHED_EMBEDS = 1000
 
 
-def each(result, error):
-    i = 0
-    if error:
-        raise error
-    elif result:
-        message_ids[i] = result['ticket_id']
+def fingerprint(embed, view):
+    """
+    Hash of what a tracker message shows; button custom ids are random, so only their looks count.
+    The timestamp is left out, every commit moves it and an edit for that alone isn't worth the rate limit.
+    """
+    buttons = [(item.label, item.style.value, str(item.emoji), item.row, item.url) for item in view.children]
+    shown = embed.to_dict()
+    shown.pop('timestamp', None)
+    content = json.dumps([shown, buttons], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode()).hexdigest()
 
 
 def getListenerURL(identifier, trackerId):
-    try:
-        server = next(
-            (item for item in GG.BUG_LISTEN_CHANS if item['tracker'] == trackerId and item['identifier'] == identifier),
-            None)
-    except:
-        return ""
-    if server is not None and server['url'] is not None:
-        return server['url']
-    else:
-        return ""
+    return GG.LISTENER_URLS.get((identifier, trackerId)) or ""
 
 
 class Ticket:
+    __slots__ = ('reporter', 'ticket_id', 'title', 'severity', '_attachments', '_raw_attachments', 'message',
+                 'subscribers', 'milestone', 'repo', 'github_issue', 'is_bug', 'is_support', 'upvotes', 'downvotes',
+                 'shrugs', 'verification', 'jumpUrl', 'trackerId', 'assignee', 'opened', 'closed', 'thread',
+                 'server_id', 'last_updated', 'votes', 'repros', 'version',
+                 '_after_commit', '_deferred', '_stored', '_snapshot', '_full', '_pushed', '_pulled', '_vote_changes', '_repro_changes')
+
     message_cache = LRUCache(maxsize=100)
+    embeds = LRUCache(maxsize=CACHED_EMBEDS)  # (ticket_id, version, detailed, icon) -> rendered embed
+    fingerprints = LRUCache(maxsize=MESSAGE_IDS)  # tracker message id -> fingerprint of what it shows
+    reacted = LRUCache(maxsize=MESSAGE_IDS)  # tracker message ids that got reactions since they were last cleared
     
     collection = GG.MDB['Tickets']
     servers = GG.MDB['Github']
-    cursor = collection.find()
-    cursor.each(callback=each)
 
-    messageIds = message_ids
+    cache = TicketCache(CACHED_TICKETS, MESSAGE_IDS)
+    messageIds = cache.messages  # filled as tracker messages are posted or looked up
+    notifier = SubscriberNotifier()
+    updater = MessageUpdater()  # shared by buttons and slash commands, so every edit of a message is debounced
 
     def __init__(self, reporter, ticket_id: str, title: str, severity: int, verification: int, attachments: list,
                  message, upvotes: int = 0, downvotes: int = 0, shrugs: int = 0, github_issue: int = None,
                  github_repo: str = None, subscribers: list = None, is_bug: bool = True, is_support: bool = False, jumpUrl: str = None,
-                 trackerId: int = None, assignee=None, milestone: list = None, opened=None, closed=None, thread=None, server_id=None, last_updated=None):
+                 trackerId: int = None, assignee=None, milestone: list = None, opened=None, closed=None, thread=None, server_id=None, last_updated=None,
+                 votes: dict = None, repros: dict = None, version: int = 0):
         if subscribers is None:
             subscribers = []
         if milestone is None:
@@ -109,7 +142,8 @@ class Ticket:
         self.title = title
         self.severity = severity
 
-        self.attachments = attachments
+        self._attachments = attachments
+        self._raw_attachments = None
         self.message = int(message)
         self.subscribers = subscribers
         self.milestone = milestone
@@ -124,7 +158,6 @@ class Ticket:
         self.shrugs = shrugs
 
         self.verification = verification
-        self.collection = GG.MDB['Tickets']
         self.jumpUrl = jumpUrl
         self.trackerId = trackerId
         self.assignee = assignee
@@ -137,6 +170,18 @@ class Ticket:
 
         self.last_updated = last_updated
 
+        # str(author) -> current upvote/downvote/shrug, and str(author) -> list of CR/CNR they gave
+        self.votes = votes
+        self.repros = repros
+        self.version = version  # bumped by every commit, a commit only lands on the version it was loaded from
+        self._after_commit = []  # Discord and GitHub work that may only happen once the change is stored
+        self._deferred = False
+        self._stored = False
+        self._snapshot = None
+        self.reset_changes()
+        if votes is None and attachments is not None:
+            self.index_votes()
+
     @classmethod
     async def new(cls, reporter, ticket_id: str, title: str, attachments: list, is_bug=True, is_support=False, repo=None, jumpUrl=None, trackerId=None, assignee=None, milestone=None, thread=None, server_id=None, last_updated=None):
         subscribers = None
@@ -169,74 +214,174 @@ class Ticket:
 
     @classmethod
     def from_dict(cls, ticket_dict):
-        ticket_dict['attachments'] = [Attachment.from_dict(a) for a in ticket_dict['attachments']]
-        return cls(**ticket_dict)
+        """Attachments stay raw dicts until something reads them, most interactions never do."""
+        raw_attachments = ticket_dict['attachments']
+        ticket_dict['attachments'] = None
+        ticket_dict.setdefault('version', None)  # stored before tickets were versioned
+        inst = cls(**ticket_dict)
+        inst._raw_attachments = raw_attachments
+        inst.mark_stored()
+        if inst.votes is None:  # stored before the vote index existed
+            inst.index_votes()
+            inst._full.update(('votes', 'repros'))
+        return inst
+
+    @property
+    def attachments(self):
+        if self._attachments is None:
+            self._attachments = [Attachment.from_dict(a) for a in self._raw_attachments or []]
+            self._raw_attachments = None
+        return self._attachments
+
+    @attachments.setter
+    def attachments(self, attachments):
+        self._attachments = attachments
+        self._raw_attachments = None
+        self._full.add('attachments')
+
+    def attachment_rows(self):
+        """(author, veri) of every attachment, without building Attachment objects."""
+        if self._attachments is None:
+            return [(a['author'], a.get('veri', 0)) for a in self._raw_attachments or []]
+        return [(a.author, a.veri) for a in self._attachments]
+
+    def index_votes(self):
+        """Builds the vote index from the attachments; committing a rebuilt index is up to the caller."""
+        self.votes = {}
+        self.repros = {}
+        for author, veri in self.attachment_rows():
+            if veri in VOTE_VERI:
+                self.votes[str(author)] = veri
+            elif veri in REPRO_VERI:
+                self.repros.setdefault(str(author), []).append(veri)
+
+    def track_vote(self, author, veri):
+        if veri in VOTE_VERI:
+            self.votes[str(author)] = veri
+            self._vote_changes[str(author)] = veri
+        elif veri in REPRO_VERI:
+            self.repros.setdefault(str(author), []).append(veri)
+            self._repro_changes.setdefault(str(author), []).append(veri)
+
+    def remove_vote(self, author):
+        """Takes back the upvote, downvote or shrug of an author and returns what it was."""
+        veri = self.votes.pop(str(author), None)
+        if veri is None:
+            return None
+        self._vote_changes[str(author)] = None
+        pushed = next((i for i in range(len(self._pushed) - 1, -1, -1)
+                       if self._pushed[i]['author'] == author and self._pushed[i].get('veri', 0) == veri), None)
+        if pushed is not None:  # cast since the last commit, so it never reached the database
+            del self._pushed[pushed]
+        else:
+            self._pulled.append({"author": author, "veri": veri})
+        if self._attachments is None:
+            rows = self._raw_attachments
+            index = next((i for i in range(len(rows) - 1, -1, -1)
+                          if rows[i]['author'] == author and rows[i].get('veri', 0) == veri), None)
+        else:
+            rows = self._attachments
+            index = next((i for i in range(len(rows) - 1, -1, -1)
+                          if rows[i].author == author and rows[i].veri == veri), None)
+        if index is not None:
+            del rows[index]
+        if veri == 2:
+            self.upvotes -= 1
+        elif veri == -2:
+            self.downvotes -= 1
+        else:
+            self.shrugs -= 1
+        return veri
+
+    def count_notes(self):
+        if self._attachments is None:
+            return sum(1 for a in self._raw_attachments or [] if a.get('veri', 0) == 0)
+        return sum(1 for a in self._attachments if a.veri == 0)
 
     def to_dict(self):
         return {
             'reporter': self.reporter, 'ticket_id': self.ticket_id, 'title': self.title, 'severity': self.severity,
             'verification': self.verification, 'upvotes': self.upvotes, 'downvotes': self.downvotes,
             'shrugs': self.shrugs,
-            'attachments': [a.to_dict() for a in self.attachments], 'message': self.message,
+            'attachments': self._raw_attachments if self._attachments is None else [a.to_dict() for a in self._attachments],
+            'message': self.message,
             'github_issue': self.github_issue, 'github_repo': self.repo, 'subscribers': self.subscribers,
             'is_bug': self.is_bug, 'is_support': self.is_support, 'jumpUrl': self.jumpUrl, 'trackerId': self.trackerId, 'assignee': self.assignee,
-            'milestone': self.milestone, 'opened': self.opened, 'closed': self.closed, 'thread': self.thread, 'server_id': self.server_id, 'last_updated': self.last_updated
+            'milestone': self.milestone, 'opened': self.opened, 'closed': self.closed, 'thread': self.thread, 'server_id': self.server_id, 'last_updated': self.last_updated,
+            'votes': self.votes, 'repros': self.repros, 'version': self.version
         }
 
     @classmethod
     async def from_id(cls, ticket_id, guild_id):
-        guild = await cls.servers.find_one({"server": guild_id})
-        trackerChannels = []
-        for channel in guild['listen']:
-            trackerChannels.append(channel['tracker'])
-        dbTicket = await cls.collection.find_one({"ticket_id": ticket_id.upper(), "trackerId": {"$in": trackerChannels}})
-        if dbTicket is not None:
-            try:
-                del dbTicket['_id']
-                ticket = cls.from_dict(dbTicket)
-                return await cls.add_server_id_backwards(ticket, guild_id)
-            except KeyError:
-                raise TicketException(f"{ticket_id} Ticket not found.")
-        else:
-            try:
-                dbTicket = await cls.collection.find_one({"ticket_id": ticket_id.upper(), "server_id": guild_id})
-                try:
-                    del dbTicket['_id']
-                    ticket = cls.from_dict(dbTicket)
-                    return await cls.add_server_id_backwards(ticket, guild_id)
-                except KeyError:
-                    raise TicketException(f"{ticket_id} Ticket not found.")
-            except:
-                raise TicketException(f"{ticket_id} Ticket not found.")
+        trackerChannels = await cls.tracker_channels(guild_id)
+        cached = cls.cache.get(ticket_id.upper())
+        if cached is not None and (cached['trackerId'] in trackerChannels or cached.get('server_id') == guild_id):
+            return await cls.add_server_id_backwards(cls.from_dict(cached), guild_id)
+        dbTicket = await cls.collection.find_one({"ticket_id": ticket_id.upper(),
+                                                  "$or": [{"server_id": guild_id}, {"trackerId": {"$in": trackerChannels}}]})
+        if dbTicket is None:
+            raise TicketException(f"{ticket_id} Ticket not found.")
+        try:
+            del dbTicket['_id']
+            cls.cache.put(dbTicket)
+            ticket = cls.from_dict(dbTicket)
+        except KeyError:
+            raise TicketException(f"{ticket_id} Ticket not found.")
+        return await cls.add_server_id_backwards(ticket, guild_id)
+
+    @classmethod
+    async def tracker_channels(cls, guild_id):
+        trackers = GG.GUILD_TRACKERS.get(guild_id)
+        if trackers is None:  # a guild loadGithubServers hasn't seen yet
+            guild = await cls.servers.find_one({"server": guild_id})
+            trackers = [channel['tracker'] for channel in guild['listen']] if guild is not None else []
+        return trackers
 
     @classmethod
     async def add_server_id_backwards(cls, ticket, guild_id):
+        """Tickets from before server_id existed get it set in place, without committing the whole ticket."""
         if ticket.server_id is None:
+            await cls.collection.update_one({"ticket_id": ticket.ticket_id, "server_id": None},
+                                            {"$set": {"server_id": guild_id}})
+            cls.cache.invalidate(ticket.ticket_id)
             ticket.server_id = guild_id
-            await ticket.commit()
+            ticket._snapshot['server_id'] = guild_id
         return ticket
 
+    @classmethod
+    async def ensure_indexes(cls):
+        try:
+            # Tickets without a tracker message hold 0 or None, only real message ids have to be unique
+            await cls.collection.create_index("message", unique=True,
+                                              partialFilterExpression={"message": {"$gt": 0}})
+        except Exception as e:
+            log.error(f"Could not create the message index on Tickets: {e}")
+        await cls.collection.create_index([("ticket_id", 1), ("server_id", 1)])
+
     @classmethod
     async def from_message_id(cls, message_id):
+        cached = cls.cache.get_by_message(message_id)
+        if cached is not None:
+            return cls.from_dict(cached)
         ticket = await cls.collection.find_one({"message": message_id})
         if ticket is not None:
             del ticket['_id']
             try:
+                cls.cache.put(ticket)
                 return cls.from_dict(ticket)
             except KeyError:
-                raise TicketException("Ticket not found.")
+                raise TicketNotFound("Ticket not found.")
         else:
-            raise TicketException("Ticket not found.")
+            raise TicketNotFound("Ticket not found.")
 
     @classmethod
-    def from_github(cls, repo_name, issue_num):
-        tickets = cls.collection.find_one({"github_repo": repo_name, "github_issue": issue_num})
-        try:
-            return cls.from_dict(
-                next(r for r in tickets.values() if
-                     r.get('github_issue') == issue_num and r.get('github_repo') == repo_name))
-        except StopIteration:
+    async def from_github(cls, repo_name, issue_num):
+        ticket = await cls.collection.find_one({"github_repo": repo_name, "github_issue": issue_num})
+        if ticket is None:
             raise TicketException("Ticket not found.")
+        del ticket['_id']
+        cls.cache.put(ticket)  # webhooks always read Mongo, so the cached copy is replaced by what is stored now
+        return cls.from_dict(ticket)
 
     def is_open(self):
         return self.severity >= 0
@@ -254,21 +399,26 @@ class Ticket:
             desc = await self.get_github_desc(bot, serverId)
 
             if self.repo != 'NoRepo':
-                issue = await GitHubClient.get_instance().create_issue(self.repo, f"{self.ticket_id} {self.title}", desc, labels)
-                log.info(f"Adding to Github: {self.repo}, {self.ticket_id}")
-                self.github_issue = issue.number
+                title = f"{self.ticket_id} {self.title}"
+                if not self._stored:  # the outbox stores the issue number on the ticket, so that has to exist first
+                    self._after_commit.append(lambda: GitHubOutbox.create_issue(self.repo, self.ticket_id, title, desc, labels))
+                    return
+                entry = await GitHubOutbox.create_issue(self.repo, self.ticket_id, title, desc, labels)
+                if entry.get('result'):  # created earlier, but this copy of the ticket missed it
+                    self.github_issue = entry['result']
 
             # await GitHubClient.get_instance().add_issue_to_project(issue.number, is_bug=self.is_bug)
 
-    async def setup_message(self, bot, guildID, trackerChannel):
+    async def get_view(self, bot):
         view = discord.ui.View()
+        if self.thread is not None:
+            thread = bot.get_channel(self.thread) or await bot.fetch_channel(self.thread)
         if self.is_bug or self.is_support:
             view.add_item(Button(label=GG.SUBSCRIBE, style=ButtonStyle.primary, emoji="📢", row=0))
             view.add_item(Button(label=GG.INFORMATION, style=ButtonStyle.primary, emoji="ℹ️", row=0))
             view.add_item(Button(label=GG.NOTE, style=ButtonStyle.primary, emoji="📝", row=0))
             if self.thread is not None:
-                url = (await bot.fetch_channel(self.thread)).jump_url
-                view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=0, url=url))
+                view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=0, url=thread.jump_url))
             view.add_item(Button(label=GG.RESOLVE, style=ButtonStyle.success, emoji="✔️", row=1))
         else:
             view.add_item(Button(label=GG.UPVOTE, style=ButtonStyle.success, emoji="⬆️", row=0))
@@ -278,22 +428,164 @@ class Ticket:
             view.add_item(Button(label=GG.INFORMATION, style=ButtonStyle.primary, emoji="ℹ️", row=1))
             view.add_item(Button(label=GG.NOTE, style=ButtonStyle.primary, emoji="📝", row=1))
             if self.thread is not None:
-                url = (await bot.fetch_channel(self.thread)).jump_url
-                view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=1, url=url))
+                view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=1, url=thread.jump_url))
             view.add_item(Button(label=GG.RESOLVE, style=ButtonStyle.success, emoji="✔️", row=2))
+        return view
 
-        ticket_message = await bot.get_channel(trackerChannel).send(embed=await self.get_embed(), view=view)
+    async def setup_message(self, bot, guildID, trackerChannel):
+        view = await self.get_view(bot)
+        embed = await self.get_embed()
+        ticket_message = await bot.get_channel(trackerChannel).send(embed=embed, view=view)
         view.stop()
 
         self.message = ticket_message.id
         Ticket.messageIds[ticket_message.id] = self.ticket_id
+        Ticket.fingerprints[ticket_message.id] = fingerprint(embed, view)
         return ticket_message
 
+    def mark_stored(self):
+        """Remembers the current state as what the database holds; commit() only writes what changes after this."""
+        self._stored = True
+        self._snapshot = {attr: getattr(self, attr) for attr in TRACKED_FIELDS}
+        self._snapshot['version'] = self.version
+        self._snapshot['subscribers'] = list(self.subscribers)
+        self._snapshot['milestone'] = list(self.milestone) if self.milestone is not None else None
+        for attr in COUNTER_FIELDS:
+            self._snapshot[attr] = getattr(self, attr)
+        self.reset_changes()
+
+    def reset_changes(self):
+        self._full = set()
+        self._pushed = []
+        self._pulled = []
+        self._vote_changes = {}
+        self._repro_changes = {}
+
+    def changes(self):
+        """
+        The update document that brings the stored ticket up to date, or an empty one. Attachments pulled and
+        pushed in the same commit (a changed vote) can't share one update, so the whole list is set instead;
+        the version filter of the commit makes sure it is the list the change was made to.
+        """
+        update = {}
+        for attr, field in TRACKED_FIELDS.items():
+            value = getattr(self, attr)
+            if value != self._snapshot[attr]:
+                update.setdefault("$set", {})[field] = value
+        for attr in COUNTER_FIELDS:
+            delta = getattr(self, attr) - self._snapshot[attr]
+            if delta:
+                update.setdefault("$inc", {})[attr] = delta
+
+        document = self.to_dict()
+        for field in self._full:
+            update.setdefault("$set", {})[field] = document[field]
+        if 'votes' not in self._full:
+            for author, veri in self._vote_changes.items():
+                if veri is None:
+                    update.setdefault("$unset", {})[f"votes.{author}"] = ""
+                else:
+                    update.setdefault("$set", {})[f"votes.{author}"] = veri
+        if 'repros' not in self._full:
+            for author, veris in self._repro_changes.items():
+                update.setdefault("$push", {})[f"repros.{author}"] = {"$each": veris}
+        if 'attachments' not in self._full:
+            if self._pulled and self._pushed:
+                update.setdefault("$set", {})["attachments"] = document['attachments']
+            elif self._pulled:
+                rows = self._pulled
+                update["$pull"] = {"attachments": rows[0] if len(rows) == 1 else {"$or": rows}}
+            elif self._pushed:
+                update["$push"] = {"attachments": {"$each": self._pushed}}
+        return update
+
     async def commit(self):
+        """
+        Writes the changes since the ticket was loaded, provided nobody else committed it in the meantime.
+        Raises TicketConflict when someone did; ``apply`` retries the operation on a fresh copy then.
+        Between ``defer_commits`` and ``commit_deferred`` it does nothing, so several operations land as one write.
+        """
+        if self._deferred:
+            return
+        if not self._stored or self.ticket_id != self._snapshot['ticket_id']:
+            self.last_updated = int(time.time())
+            await self.collection.replace_one({"ticket_id": self.ticket_id}, self.to_dict(), upsert=True)
+            self.mark_stored()
+            self.cache.put(self.to_dict())
+            await self.run_after_commit()
+            return
+
+        update = self.changes()
+        if not update:
+            await self.run_after_commit()
+            return
         self.last_updated = int(time.time())
-        await self.collection.replace_one({"ticket_id": self.ticket_id}, self.to_dict(), upsert=True)
+        update.setdefault("$set", {})['last_updated'] = self.last_updated
+        update.setdefault("$inc", {})['version'] = 1
+        version = self._snapshot['version']
+        result = await self.collection.update_one({"ticket_id": self.ticket_id, "version": version}, update)
+        if result.matched_count != 1:
+            self.cache.invalidate(self.ticket_id)
+            raise TicketConflict(f"{self.ticket_id} was changed by someone else in the meantime.")
+        self.version = (version or 0) + 1
+        self.mark_stored()
+        self.cache.put(self.to_dict())
+        await self.run_after_commit()
+
+    def defer_commits(self):
+        self._deferred = True
+
+    async def commit_deferred(self):
+        self._deferred = False
+        await self.commit()
+
+    async def run_after_commit(self):
+        callbacks = list(self._after_commit)
+        self._after_commit.clear()
+        for callback in callbacks:
+            await callback()
+
+    async def fresh(self):
+        """The ticket as it is in the database right now."""
+        data = await self.collection.find_one({"ticket_id": self.ticket_id})
+        if data is None:
+            raise TicketException(f"{self.ticket_id} Ticket not found.")
+        del data['_id']
+        self.cache.put(data)
+        return Ticket.from_dict(data)
+
+    async def apply(self, operation, attempts=COMMIT_ATTEMPTS):
+        """
+        Runs ``await operation(ticket)``, which is expected to commit, and returns the ticket it succeeded on.
+        When the commit loses a race the ticket is read again and the operation runs again on the new copy.
+        """
+        ticket = self
+        for attempt in range(attempts):
+            try:
+                await operation(ticket)
+                return ticket
+            except TicketConflict:
+                if attempt + 1 == attempts:
+                    raise
+                log.info(f"Commit conflict on {ticket.ticket_id}, retrying ({attempt + 1}/{attempts}).")
+                await asyncio.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+                ticket = await ticket.fresh()
 
     async def get_embed(self, detailed=False, ctx=None):
+        """
+        Rendered embeds of committed tickets are kept per version, rendering the same version again is a copy.
+        With a ``ctx`` the notes show member names of that guild, those embeds aren't kept.
+        """
+        if ctx is not None or not self._stored or self.changes():
+            return await self.render_embed(detailed, ctx)
+        key = (self.ticket_id, self.version, detailed, getListenerURL(self.ticket_id.split("-")[0], self.trackerId))
+        embed = self.embeds.get(key)
+        if embed is None:
+            embed = await self.render_embed(detailed)
+            Ticket.embeds[key] = embed
+        return embed.copy()
+
+    async def render_embed(self, detailed=False, ctx=None):
         embed = discord.Embed()
         if isinstance(self.reporter, int):
             embed.add_field(name="Added By", value=f"<@{self.reporter}>")
@@ -334,10 +626,7 @@ class Ticket:
         if self.github_issue:
             embed.url = f"{GITHUB_BASE}/{self.repo}/issues/{self.github_issue}"
 
-        countNotes = 0
-        for attachment in self.attachments:
-            if attachment.veri == 0:
-                countNotes += 1
+        countNotes = self.count_notes()
         if countNotes == 1:
             embed.description = f"*{countNotes} note*"
         else:
@@ -464,7 +753,7 @@ class Ticket:
         if self.attachments:
             msg = self.attachments[0].message
 
-        author = next((m for m in bot.get_all_members() if m.id == self.reporter), None)
+        author = bot.get_user(self.reporter) if isinstance(self.reporter, int) else None
         if author:
             desc = f"{msg}\n\n- {author}"
         else:
@@ -505,19 +794,41 @@ class Ticket:
         return f"https://github.com/{self.repo}/issues/{self.github_issue}"
 
     async def add_attachment(self, ctx, serverId, attachment: Attachment, add_to_github=True):
-        self.attachments.append(attachment)
+        if self._attachments is None:
+            self._raw_attachments.append(attachment.to_dict())
+        else:
+            self._attachments.append(attachment)
+        self._pushed.append(attachment.to_dict())
+        self.track_vote(attachment.author, attachment.veri)
         if add_to_github and self.github_issue and (self.repo is not None or self.repo != 'NoRepo'):
             if attachment.message:
                 msg = await self.get_attachment_message(ctx.bot, attachment, serverId)
-                await GitHubClient.get_instance().add_issue_comment(self.repo, self.github_issue, msg)
+                self._after_commit.append(lambda: GitHubOutbox.comment(self.repo, self.github_issue, msg, self.ticket_id))
 
             if attachment.veri:
-                gitDesc = await self.get_github_desc(ctx.bot, serverId)
-                await GitHubClient.get_instance().edit_issue_body(self.repo, self.github_issue, gitDesc)
+                self._after_commit.append(lambda: GitHubOutbox.sync_body(self.repo, self.github_issue, self.ticket_id, serverId))
+
+    async def absorb(self, ctx, serverId, dupe):
+        """
+        Takes over the attachments of a duplicate. Someone who voted on both keeps their vote on this ticket and the
+        same CR/CNR isn't counted twice, so the counters keep matching the vote index.
+        """
+        for attachment in dupe.attachments:
+            author = str(attachment.author)
+            if attachment.veri in VOTE_VERI:
+                if author in self.votes:
+                    continue
+                counter = VOTE_COUNTERS[attachment.veri]
+                setattr(self, counter, getattr(self, counter) + 1)
+            elif attachment.veri in REPRO_VERI:
+                if attachment.veri in self.repros.get(author, ()):
+                    continue
+                self.verification += attachment.veri
+            await self.add_attachment(ctx, serverId, attachment, False)
 
     async def get_attachment_message(self, bot, attachment: Attachment, guild_id):
         if isinstance(attachment.author, int):
-            username = str(next((m for m in bot.get_all_members() if m.id == attachment.author), attachment.author))
+            username = str(bot.get_user(attachment.author) or attachment.author)
         else:
             username = attachment.author
 
@@ -530,7 +841,7 @@ class Ticket:
 
     async def canrepro(self, author, msg, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Can reproduce", f"{self.ticket_id}", f"{author}")
-        if [a for a in self.attachments if a.author == author and a.veri == 1]:
+        if 1 in self.repros.get(str(author), ()):
             raise TicketException("You have already verified this ticket.")
         if not self.is_bug:
             raise TicketException("You cannot CR a feature request or support ticket.")
@@ -542,7 +853,7 @@ class Ticket:
 
     async def cannotrepro(self, author, msg, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Can't reproduce", f"{self.ticket_id}", f"{author}")
-        if [a for a in self.attachments if a.author == author and a.veri == -1]:
+        if -1 in self.repros.get(str(author), ()):
             raise TicketException("You have already verified this ticket.")
         if not self.is_bug:
             raise TicketException("You cannot CNR a feature request or support ticket.")
@@ -554,20 +865,13 @@ class Ticket:
 
     async def upvote(self, author, msg, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Upvote", f"{self.ticket_id}", f"{author}")
-        for attachment in self.attachments:
-            if attachment.author == author and attachment.veri == 2:
-                raise TicketException(f"You have already upvoted {self.ticket_id}.")
-            if attachment.author == author and attachment.veri == -2:
-                self.downvotes -= 1
-                self.attachments.remove(attachment)
-            elif attachment.author == author and attachment.veri == 3:
-                self.shrugs -= 1
-                self.attachments.remove(attachment)
-
+        if self.votes.get(str(author)) == 2:
+            raise TicketException(f"You have already upvoted {self.ticket_id}.")
         if self.is_bug:
             raise TicketException("You cannot upvote a bug.")
         if self.is_support:
             raise TicketException("You cannot upvote a support ticket.")
+        self.remove_vote(author)
         attachment = Attachment.upvote(author, msg)
         self.upvotes += 1
         await self.add_attachment(ctx, serverId, attachment)
@@ -589,20 +893,13 @@ class Ticket:
 
     async def downvote(self, author, msg, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Downvote", f"{self.ticket_id}", f"{author}")
-        for attachment in self.attachments:
-            if attachment.author == author and attachment.veri == 2:
-                self.upvotes -= 1
-                self.attachments.remove(attachment)
-            if attachment.author == author and attachment.veri == -2:
-                raise TicketException(f"You have already downvoted {self.ticket_id}.")
-            if attachment.author == author and attachment.veri == 3:
-                self.shrugs -= 1
-                self.attachments.remove(attachment)
-
+        if self.votes.get(str(author)) == -2:
+            raise TicketException(f"You have already downvoted {self.ticket_id}.")
         if self.is_bug:
             raise TicketException("You cannot downvote a bug.")
         if self.is_support:
             raise TicketException("You cannot downvote a support ticket.")
+        self.remove_vote(author)
         attachment = Attachment.downvote(author, msg)
         self.downvotes += 1
         await self.add_attachment(ctx, serverId, attachment)
@@ -615,20 +912,13 @@ class Ticket:
 
     async def indifferent(self, author, msg, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Indifferent", f"{self.ticket_id}", f"{author}")
-        for attachment in self.attachments:
-            if attachment.author == author and attachment.veri == 2:
-                self.upvotes -= 1
-                self.attachments.remove(attachment)
-            if attachment.author == author and attachment.veri == -2:
-                self.downvotes -= 1
-                self.attachments.remove(attachment)
-            if attachment.author == author and attachment.veri == 3:
-                raise TicketException(f"You were already indifferent about {self.ticket_id}.")
-
+        if self.votes.get(str(author)) == 3:
+            raise TicketException(f"You were already indifferent about {self.ticket_id}.")
         if self.is_bug:
             raise TicketException("You cannot be indifferent about a bug.")
         if self.is_support:
             raise TicketException("You cannot be indifferent about a support ticket.")
+        self.remove_vote(author)
         attachment = Attachment.indifferent(author, msg)
         self.shrugs += 1
         await self.add_attachment(ctx, serverId, attachment)
@@ -636,13 +926,16 @@ class Ticket:
         await self.commit()
 
     async def addnote(self, author, msg, ctx, serverId, add_to_github=True):
+        await self.note(author, msg, ctx, serverId, add_to_github)
+        await self.commit()
+
+    async def note(self, author, msg, ctx, serverId, add_to_github=True):
+        """Adds a note without committing, for operations that commit it together with their own changes."""
         await track_analytics_event("IssueCrawler", "Note", f"{self.ticket_id}", f"{author}")
         attachment = Attachment(author, msg)
         await self.add_attachment(ctx, serverId, attachment, add_to_github)
         await self.notify_subscribers(ctx.bot, f"New note by <@{author}>: {msg}")
 
-        await self.commit()
-
     async def force_accept(self, ctx, serverId):
         await track_analytics_event("IssueCrawler", "Force Accept", f"{self.ticket_id}", f"{serverId}")
         await self.setup_github(ctx.bot, serverId)
@@ -655,21 +948,11 @@ class Ticket:
         ts = calendar.timegm(time.gmtime())
         self.closed = ts
         guild = next(item for item in GG.GITHUBSERVERS if item.server == serverId)
-        await self.addnote(guild.admin, f"Resolved - This ticket was denied.", ctx, serverId)
-
-        msg_ = await self.get_message(ctx, serverId)
-        if msg_:
-            try:
-                await msg_.delete()
-                if self.message in Ticket.message_cache:
-                    del Ticket.message_cache[self.message]
-                if self.message in Ticket.messageIds:
-                    del Ticket.messageIds[self.message]
-            finally:
-                self.message = None
+        await self.note(guild.admin, f"Resolved - This ticket was denied.", ctx, serverId)
+        self.drop_message(ctx)
 
         if self.github_issue:
-            await GitHubClient.get_instance().close_issue(self.repo, self.github_issue)
+            self._after_commit.append(lambda: GitHubOutbox.close(self.repo, self.github_issue, self.ticket_id))
 
         await self.commit()
 
@@ -688,63 +971,85 @@ class Ticket:
     async def get_message(self, ctx, serverId):
         if self.message is None:
             return None
-        elif self.message in self.message_cache:
-            return self.message_cache[self.message]
-        else:
-            try:
-                msg = await ctx.bot.get_channel(self.trackerId).fetch_message(self.message)
-            except AttributeError:
-                msg = await ctx.bot.get_channel(ctx.channel.id).fetch_message(self.message)
-            if msg:
-                Ticket.message_cache[self.message] = msg
-            return msg
+        return await self.fetch_message(ctx, self.message)
+
+    async def fetch_message(self, ctx, message_id):
+        if message_id in self.message_cache:
+            return self.message_cache[message_id]
+        try:
+            msg = await ctx.bot.get_channel(self.trackerId).fetch_message(message_id)
+        except AttributeError:
+            msg = await ctx.bot.get_channel(ctx.channel.id).fetch_message(message_id)
+        if msg:
+            Ticket.message_cache[message_id] = msg
+        return msg
 
     async def delete_message(self, ctx, serverId):
-        msg_ = await self.get_message(ctx, serverId)
-        if msg_ is not None:
-            try:
-                await msg_.delete()
-                if self.message in Ticket.message_cache:
-                    del Ticket.message_cache[self.message]
-                if self.message in Ticket.messageIds:
-                    del Ticket.messageIds[self.message]
-            except discord.HTTPException:
-                pass
-            except Exception as e:
-                print(e)
-            finally:
-                self.message = None
+        if self.message:
+            await self.delete_tracker_message(ctx, self.message)
+        self.message = None
+
+    def drop_message(self, ctx):
+        """Detaches the tracker message; it is deleted once the ticket is committed without it."""
+        message_id = self.message
+        self.message = None
+        if message_id:
+            self._after_commit.append(lambda: self.delete_tracker_message(ctx, message_id))
+
+    async def delete_tracker_message(self, ctx, message_id):
+        try:
+            msg_ = await self.fetch_message(ctx, message_id)
+            await msg_.delete()
+        except discord.HTTPException:  # deleted already
+            pass
+        except Exception as e:
+            print(e)
+        finally:
+            Ticket.message_cache.pop(message_id, None)
+            Ticket.messageIds.pop(message_id, None)
+            Ticket.fingerprints.pop(message_id, None)
+
+    async def post_message(self, bot, serverId):
+        """
+        Posts the tracker message of a committed ticket and stores its id. Nothing else sets the message of a
+        ticket in the meantime, so the id is stored without a version check; only the version is bumped.
+        """
+        await self.setup_message(bot, serverId, self.trackerId)
+        stored = await self.collection.find_one_and_update({"ticket_id": self.ticket_id},
+                                                           {"$set": {"message": self.message}, "$inc": {"version": 1}},
+                                                           projection={"version": 1},
+                                                           return_document=ReturnDocument.AFTER)
+        self._snapshot['message'] = self.message
+        if stored is not None and stored['version'] == (self.version or 0) + 1:
+            self.version = self._snapshot['version'] = stored['version']
+            self.cache.put(self.to_dict())
+        else:  # committed by someone else in between, the next commit of this copy conflicts and reloads
+            self.cache.invalidate(self.ticket_id)
 
     async def update(self, ctx, serverId):
         msg = await self.get_message(ctx, serverId)
         if msg is None and self.is_open():
             await self.setup_message(ctx.bot, serverId, self.trackerId)
         elif self.is_open():
-            await msg.clear_reactions()
-            view = discord.ui.View()
-            if self.is_bug or self.is_support:
-                view.add_item(Button(label=GG.SUBSCRIBE, style=ButtonStyle.primary, emoji="📢", row=0))
-                view.add_item(Button(label=GG.INFORMATION, style=ButtonStyle.primary, emoji="ℹ️", row=0))
-                view.add_item(Button(label=GG.NOTE, style=ButtonStyle.primary, emoji="📝", row=0))
-                if self.thread is not None:
-                    url = (await ctx.bot.fetch_channel(self.thread)).jump_url
-                    view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=0, url=url))
-                view.add_item(Button(label=GG.RESOLVE, style=ButtonStyle.success, emoji="✔️", row=1))
-            else:
-                view.add_item(Button(label=GG.UPVOTE, style=ButtonStyle.success, emoji="⬆️", row=0))
-                view.add_item(Button(label=GG.DOWNVOTE, style=ButtonStyle.danger, emoji="⬇️", row=0))
-                view.add_item(Button(label=GG.SHRUG, style=ButtonStyle.secondary, emoji="🤷", row=0))
-                view.add_item(Button(label=GG.SUBSCRIBE, style=ButtonStyle.primary, emoji="📢", row=1))
-                view.add_item(Button(label=GG.INFORMATION, style=ButtonStyle.primary, emoji="ℹ️", row=1))
-                view.add_item(Button(label=GG.NOTE, style=ButtonStyle.primary, emoji="📝", row=1))
-                if self.thread is not None:
-                    url = (await ctx.bot.fetch_channel(self.thread)).jump_url
-                    view.add_item(Button(label=GG.THREAD, style=ButtonStyle.primary, emoji="🧵", row=1, url=url))
-                view.add_item(Button(label=GG.RESOLVE, style=ButtonStyle.success, emoji="✔️", row=2))
-
-            await msg.edit(embed=await self.get_embed(), view=view)
+            if msg.reactions or Ticket.reacted.pop(msg.id, None):
+                await msg.clear_reactions()
+                msg.reactions.clear()
+            view = await self.get_view(ctx.bot)
+            embed = await self.get_embed()
+            content = fingerprint(embed, view)
+            if Ticket.fingerprints.get(msg.id) != content:  # only edit when something visible changed
+                await msg.edit(embed=embed, view=view)
+                Ticket.fingerprints[msg.id] = content
             view.stop()
 
+    async def schedule_update(self, ctx, serverId):
+        """Refreshes the tracker message through the shared updater; tickets without one get it posted right away."""
+        if not self.message:
+            return await self.update(ctx, serverId)
+        message_id = self.message
+        self.updater.schedule(message_id, self.trackerId, lambda: Ticket.from_message_id(message_id),
+                              lambda ticket: ticket.update(ctx, serverId))
+
     async def resolve(self, ctx, serverId, msg='', close_github_issue=True, pend=False, ignore_closed=False):
         if self.severity == -1 and not ignore_closed:
             raise TicketException("This ticket is already closed.")
@@ -759,10 +1064,11 @@ class Ticket:
             await self.notify_subscribers(ctx.bot, f"Ticket resolved.")
 
         if msg:
-            await self.addnote(ctx.interaction.user.id, f"Resolved - {msg}", ctx, serverId)
+            await self.note(ctx.interaction.user.id, f"Resolved - {msg}", ctx, serverId)
 
         await track_analytics_event("IssueCrawler", "Resolve", f"{self.ticket_id}", f"{serverId}")
-        await self.delete_message(ctx, serverId)
+        # Discord and GitHub only hear about it once it is stored, a retry after a conflict must not repeat them
+        self.drop_message(ctx)
 
         if close_github_issue and self.github_issue and (self.repo is not None or self.repo != 'NoRepo'):
             extra_labels = set()
@@ -772,28 +1078,32 @@ class Ticket:
                 label = label_match.group(1)
                 if label in VALID_LABELS:
                     extra_labels.add(label)
+            ops = []
             if extra_labels:
-                await GitHubClient.get_instance().label_issue(self.repo, self.github_issue,
-                                                              self.get_labels() + list(extra_labels))
-            await GitHubClient.get_instance().close_issue(self.repo, self.github_issue)
+                ops.append(["labels", self.get_labels() + list(extra_labels)])
+            ops.append(["state", "closed"])
+            self._after_commit.append(lambda: GitHubOutbox.batch(self.repo, self.github_issue, ops, self.ticket_id))
 
         if self.thread is not None:
-            channel = await ctx.bot.fetch_channel(self.thread)
-            name = channel.name
-            extra = len(f"{self.ticket_id} - ")
-            extra += len(f"[Resolved] ")
-            maxThreadTitleLength = 97 - extra
-            if len(name) > maxThreadTitleLength:
-                await channel.edit(name=f"[Resolved] - {name[:maxThreadTitleLength]}...", auto_archive_duration=1440)
-            else:
-                await channel.edit(name=f"[Resolved] - {name}", auto_archive_duration=1440)
-            await channel.send(f"{msg}\n\nThis thread will now automatically archive itself in 1 day.")
+            self._after_commit.append(lambda: self.archive_thread(ctx.bot, msg))
 
         if pend:
-            await self.pend()
+            self._after_commit.append(self.pend)
 
         await self.commit()
 
+    async def archive_thread(self, bot, msg):
+        channel = await bot.fetch_channel(self.thread)
+        name = channel.name
+        extra = len(f"{self.ticket_id} - ")
+        extra += len(f"[Resolved] ")
+        maxThreadTitleLength = 97 - extra
+        if len(name) > maxThreadTitleLength:
+            await channel.edit(name=f"[Resolved] - {name[:maxThreadTitleLength]}...", auto_archive_duration=1440)
+        else:
+            await channel.edit(name=f"[Resolved] - {name}", auto_archive_duration=1440)
+        await channel.send(f"{msg}\n\nThis thread will now automatically archive itself in 1 day.")
+
     async def unresolve(self, ctx, serverId, msg='', open_github_issue=True):
         if not self.severity == -1:
             raise TicketException("This ticket is still open.")
@@ -802,22 +1112,23 @@ class Ticket:
         self.closed = None
         await self.notify_subscribers(ctx.bot, f"Ticket unresolved.")
         if msg:
-            await self.addnote(ctx.interaction.user.id, f"Unresolved - {msg}", ctx, serverId)
+            await self.note(ctx.interaction.user.id, f"Unresolved - {msg}", ctx, serverId)
 
         await track_analytics_event("IssueCrawler", "Unresolve", f"{self.ticket_id}", f"{serverId}")
-        await self.setup_message(ctx.bot, serverId, self.trackerId)
+        self._after_commit.append(lambda: self.post_message(ctx.bot, serverId))
 
         if open_github_issue and self.github_issue and (self.repo is not None or self.repo != 'NoRepo'):
-            await GitHubClient.get_instance().open_issue(self.repo, self.github_issue)
+            self._after_commit.append(lambda: GitHubOutbox.reopen(self.repo, self.github_issue, self.ticket_id))
 
         await self.commit()
 
     async def untrack(self, ctx, serverId):
+        await self.collection.delete_one({"ticket_id": self.ticket_id})
+        self.cache.invalidate(self.ticket_id)
+
         await self.delete_message(ctx, serverId)
         if self.github_issue:
-            await GitHubClient.get_instance().rename_issue(self.repo, self.github_issue, self.title)
-
-        await self.collection.delete_one({"ticket_id": self.ticket_id})
+            await GitHubOutbox.rename(self.repo, self.github_issue, self.title, self.ticket_id)
 
     async def pend(self):
         collection = GG.MDB['PendingTickets']
@@ -838,31 +1149,30 @@ class Ticket:
         return [l for l in labels if l]
 
     async def update_labels(self):
-        labels = self.get_labels()
-        await GitHubClient.get_instance().label_issue(self.repo, self.github_issue, labels)
+        """Relabels the GitHub issue once the ticket is committed."""
+        self._after_commit.append(lambda: GitHubOutbox.label(self.repo, self.github_issue, self.get_labels(), self.ticket_id))
 
     async def edit_title(self, new_title, idnum=""):
         self.title = new_title
         githubTitle = f"{idnum}{new_title}"
-        await GitHubClient.get_instance().rename_issue(self.repo, self.github_issue, githubTitle)
+        self._after_commit.append(lambda: GitHubOutbox.rename(self.repo, self.github_issue, githubTitle, self.ticket_id))
 
     async def notify_subscribers(self, bot, msg):
+        """DMs the subscribers in the background once the change is committed, so a retried commit doesn't send twice."""
         msg = f"`{self.ticket_id}` - {self.title}: {msg}"
-        for sub in self.subscribers:
-            try:
-                member = next(m for m in bot.get_all_members() if m.id == sub)
-                await member.send(msg)
-            except (StopIteration, discord.HTTPException):
-                continue
+        subscribers = list(self.subscribers)
+        self._after_commit.append(lambda: self.notify(bot, subscribers, msg))
+
+    async def notify(self, bot, subscribers, msg):
+        self.notifier.notify(bot, subscribers, msg)
 
 
 async def get_next_ticket_num(identifier, server):
-    ticketNum = await GG.MDB.TicketNums.find_one({'key': f'{identifier}', 'server': server})
+    ticketNum = await GG.MDB.TicketNums.find_one_and_update({'key': f'{identifier}', 'server': server},
+                                                            {"$inc": {"amount": 1}},
+                                                            return_document=ReturnDocument.AFTER)
     if ticketNum is not None:
-        num = ticketNum['amount'] + 1
-        ticketNum['amount'] += 1
-        num = formatNumber(num)
-        await GG.MDB.TicketNums.replace_one({"key": f'{identifier}', 'server': server}, ticketNum)
+        num = formatNumber(ticketNum['amount'])
         return f"{num}"
     else:
         raise TicketException(f"The bot couldn't find the `{identifier}` identifier.\n"
@@ -904,3 +1214,11 @@ def identifier_from_repo(repo_name):
 
 class TicketException(CrawlerException):
     pass
+
+
+class TicketConflict(TicketException):
+    pass
+
+
+class TicketNotFound(TicketException):
+    pass
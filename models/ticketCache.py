@@ -0,0 +1,65 @@
+from cachetools import LRUCache
+
+
+class TicketCache:
+    """
+    Stored ticket documents, so a button press doesn't have to read the ticket from Mongo first.
+    Entries are keyed by ticket id, with a second map from tracker message id to ticket id. A commit writes
+    its result through; anything that changes a ticket behind the model's back has to ``invalidate`` it.
+    A stale entry can't lose data, the versioned commit refuses it and the ticket is read again.
+    """
+
+    def __init__(self, maxsize=2000, messages=10000):
+        self.docs = LRUCache(maxsize=maxsize)
+        self.messages = LRUCache(maxsize=messages)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def copy(doc):
+        """A copy whose lists and dicts can be changed freely; the attachment dicts themselves are never changed."""
+        doc = dict(doc)
+        for field in ('attachments', 'subscribers', 'milestone'):
+            if doc.get(field) is not None:
+                doc[field] = list(doc[field])
+        if doc.get('votes') is not None:
+            doc['votes'] = dict(doc['votes'])
+        if doc.get('repros') is not None:
+            doc['repros'] = {uid: list(veris) for uid, veris in doc['repros'].items()}
+        return doc
+
+    def get(self, ticket_id):
+        doc = self.docs.get(ticket_id)
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.copy(doc)
+
+    def get_by_message(self, message_id):
+        ticket_id = self.messages.get(message_id)
+        doc = self.docs.get(ticket_id) if ticket_id is not None else None
+        if doc is None or doc.get('message') != message_id:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.copy(doc)
+
+    def put(self, doc):
+        doc = self.copy(doc)
+        doc.pop('_id', None)
+        self.docs[doc['ticket_id']] = doc
+        if doc.get('message'):
+            self.messages[doc['message']] = doc['ticket_id']
+
+    def invalidate(self, ticket_id):
+        if self.docs.pop(ticket_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "entries": len(self.docs),
+            "hit_rate": self.hits / lookups if lookups else 0
+        }
@@ -0,0 +1,78 @@
+import asyncio
+
+from models.ticket import TicketException
+
+from utils import globals as GG
+
+log = GG.log
+
+
+class TicketQueue:
+    """
+    Runs the operations on one ticket one batch at a time, while different tickets run side by side.
+    Everything queued for a ticket while the previous batch was busy becomes the next batch: the ticket is
+    loaded once, every operation runs against it in order, and the result is stored with a single commit
+    followed by a single ``after`` call (the tracker message edit).
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.tasks = {}
+        self.batches = 0
+        self.operations = 0
+
+    def submit(self, key, load, operation, after=None):
+        """
+        Queues ``await operation(ticket)`` for the ticket ``load()`` returns and gives back a future for its outcome.
+        ``after(ticket)`` runs once the batch is committed, the one of the latest operation wins.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.pending.setdefault(key, []).append((load, operation, after, future))
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.get_event_loop().create_task(self.run(key))
+        return future
+
+    async def run(self, key):
+        try:
+            while self.pending.get(key):
+                await self.process(self.pending.pop(key))
+        finally:
+            self.tasks.pop(key, None)
+
+    async def process(self, batch):
+        self.batches += 1
+        self.operations += len(batch)
+        load = batch[-1][0]
+        after = next((entry[2] for entry in reversed(batch) if entry[2] is not None), None)
+        errors = {}
+
+        async def run_batch(ticket):
+            errors.clear()
+            ticket.defer_commits()
+            for _, operation, _, future in batch:
+                try:
+                    await operation(ticket)
+                except TicketException as e:  # a refused vote doesn't stop the rest of the batch
+                    errors[future] = e
+            await ticket.commit_deferred()
+
+        try:
+            ticket = await load()
+            ticket = await ticket.apply(run_batch)
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(errors.get(future, e))
+            return
+        if after is not None:
+            try:
+                await after(ticket)
+            except Exception as e:
+                log.error(f"Could not refresh {ticket.ticket_id} after its batch: {e}")
+        for *_, future in batch:
+            if future in errors:
+                future.set_exception(errors[future])
+            else:
+                future.set_result(ticket)
+
+    def stats(self):
+        return {"batches": self.batches, "operations": self.operations, "queued": sum(map(len, self.pending.values()))}
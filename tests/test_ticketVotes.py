@@ -0,0 +1,165 @@
+"""
+Vote bookkeeping and retries of Ticket commits, against an in-memory Mongo (``pip install mongomock-motor``).
+"""
+import os
+import unittest
+from unittest import mock
+
+for name, value in (('PREFIX', '!'), ('TOKEN', 'x'), ('TEST_TOKEN', 'x'), ('COGS', 'cogs'), ('OWNER', '1'),
+                    ('GITHUB_TOKEN', 'x'), ('GITHUB_REPO', 'x'), ('MONGODB', 'mongodb://localhost')):
+    os.environ.setdefault(name, value)
+
+try:
+    import mongomock
+    from mongomock_motor import AsyncMongoMockClient
+    mongomock.SERVER_VERSION = '6.0'  # mongomock reads its version from MONGODB as well
+except ImportError:
+    AsyncMongoMockClient = None
+
+from utils import globals as GG
+
+if AsyncMongoMockClient is not None:
+    GG.MDB = AsyncMongoMockClient()['issuetracking']
+
+from models.ticket import Ticket, TicketConflict  # noqa: E402, bound to the mock database above
+
+
+class Server:
+    server = 1
+    threshold = 1000
+
+
+class Context:
+    bot = None
+
+
+class Message:
+    def __init__(self, deleted):
+        self.deleted = deleted
+
+    async def delete(self):
+        self.deleted.append(True)
+
+
+class Channel:
+    def __init__(self, deleted):
+        self.deleted = deleted
+
+    async def fetch_message(self, message_id):
+        return Message(self.deleted)
+
+
+class Bot:
+    def __init__(self):
+        self.deleted = []
+
+    def get_channel(self, channel_id):
+        return Channel(self.deleted)
+
+
+async def nothing(*args, **kwargs):
+    pass
+
+
+@unittest.skipIf(AsyncMongoMockClient is None, "mongomock-motor is not installed")
+@mock.patch('models.ticket.track_analytics_event', nothing)
+class TicketVoteTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        GG.GITHUBSERVERS = [Server()]
+        Ticket.cache.docs.clear()
+        await Ticket.collection.delete_many({})
+        await Ticket.collection.insert_one({
+            'reporter': 1, 'ticket_id': "FR-1", 'title': "A feature", 'severity': 6, 'verification': 0,
+            'upvotes': 1, 'downvotes': 0, 'shrugs': 0, 'message': 0, 'github_issue': 0, 'github_repo': "NoRepo",
+            'subscribers': [], 'is_bug': False, 'is_support': False, 'jumpUrl': None, 'trackerId': 1,
+            'assignee': None, 'milestone': [], 'opened': 0, 'closed': None, 'thread': None, 'server_id': 1,
+            'last_updated': 0, 'version': 1, 'votes': {"10": 2}, 'repros': {},
+            'attachments': [{"author": 1, "message": "The request.", "veri": 0},
+                            {"author": 10, "message": None, "veri": 2}],
+        })
+
+    async def load(self):
+        data = await Ticket.collection.find_one({"ticket_id": "FR-1"})
+        del data['_id']
+        return Ticket.from_dict(data)
+
+    async def assertConsistent(self):
+        data = await Ticket.collection.find_one({"ticket_id": "FR-1"})
+        votes = {str(a['author']): a['veri'] for a in data['attachments'] if a['veri'] in (2, -2, 3)}
+        self.assertEqual(len(votes), sum(1 for a in data['attachments'] if a['veri'] in (2, -2, 3)))
+        self.assertEqual(votes, data['votes'])
+        self.assertEqual(data['upvotes'], list(votes.values()).count(2))
+        self.assertEqual(data['downvotes'], list(votes.values()).count(-2))
+        return data
+
+    async def test_cast_and_switch_in_one_commit(self):
+        ticket = await self.load()
+        ticket.defer_commits()
+        await ticket.upvote(20, '', Context(), 1)
+        await ticket.downvote(20, '', Context(), 1)
+        await ticket.commit_deferred()
+
+        data = await self.assertConsistent()
+        self.assertEqual(data['votes'], {"10": 2, "20": -2})
+        self.assertEqual(data['version'], 2)
+
+    async def test_switch_a_stored_vote(self):
+        ticket = await self.load()
+        await ticket.downvote(10, '', Context(), 1)
+
+        data = await self.assertConsistent()
+        self.assertEqual(data['votes'], {"10": -2})
+
+    async def test_losing_the_race_writes_nothing(self):
+        ticket = await self.load()
+        await Ticket.collection.update_one({"ticket_id": "FR-1"}, {"$inc": {"version": 1}})
+        with self.assertRaises(TicketConflict):
+            await ticket.downvote(10, '', Context(), 1)
+
+        data = await self.assertConsistent()
+        self.assertEqual(data['votes'], {"10": 2})
+        self.assertEqual(len(data['attachments']), 2)
+
+    async def test_merging_counts_each_voter_once(self):
+        dupe = Ticket.from_dict({
+            'reporter': 2, 'ticket_id': "FR-2", 'title': "The same feature", 'severity': 6, 'verification': 0,
+            'upvotes': 1, 'downvotes': 1, 'shrugs': 0, 'message': 0, 'github_issue': 0, 'github_repo': "NoRepo",
+            'subscribers': [], 'is_bug': False, 'is_support': False, 'jumpUrl': None, 'trackerId': 1,
+            'assignee': None, 'milestone': [], 'opened': 0, 'closed': None, 'thread': None, 'server_id': 1,
+            'last_updated': 0, 'version': 1, 'votes': {"10": -2, "30": 2}, 'repros': {},
+            'attachments': [{"author": 2, "message": "The same request.", "veri": 0},
+                            {"author": 10, "message": None, "veri": -2},
+                            {"author": 30, "message": None, "veri": 2}],
+        })
+        ticket = await self.load()
+        await ticket.absorb(Context(), 1, dupe)
+        await ticket.commit()
+
+        data = await self.assertConsistent()
+        self.assertEqual(data['votes'], {"10": 2, "30": 2})
+        self.assertEqual(len(data['attachments']), 4)
+
+    async def test_retried_resolve_deletes_the_message_once(self):
+        await Ticket.collection.update_one({"ticket_id": "FR-1"}, {"$set": {"message": 555}})
+        ticket = await self.load()
+        await Ticket.collection.update_one({"ticket_id": "FR-1"}, {"$inc": {"version": 1}})
+        ctx = Context()
+        ctx.bot = Bot()
+
+        calls = []
+
+        async def resolve(ticket):
+            calls.append(ticket)
+            await ticket.resolve(ctx, 1, close_github_issue=False)
+
+        await ticket.apply(resolve)
+        data = await Ticket.collection.find_one({"ticket_id": "FR-1"})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(ctx.bot.deleted, [True])
+        self.assertEqual(data['severity'], -1)
+        self.assertIsNone(data['message'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -23,6 +23,8 @@ async def loadGithubServers():
     GG.ADMINS = []
     GG.SERVERS = []
     GG.BUG_LISTEN_CHANS = []
+    trackers = {}
+    urls = {}
     servers = await GG.MDB.Github.find({}).to_list(length=None)
     for server in servers:
         newServer = Server.from_data(server)
@@ -31,11 +33,15 @@ async def loadGithubServers():
         GG.SERVERS.append(newServer.server)
     for server in GG.GITHUBSERVERS:
         orgs.append(server.org)
+        trackers[server.server] = [channel.tracker for channel in server.listen]
         for channel in server.listen:
             add = {"channel": channel.channel, "tracker": channel.tracker,
                    "identifier": channel.identifier, "type": channel.type, "repo": channel.repo, "url": channel.url}
             GG.BUG_LISTEN_CHANS.append(add)
-    GitHubClient.initialize(GG.GITHUB_TOKEN, orgs)
+            urls.setdefault((channel.identifier, channel.tracker), channel.url)
+    GG.GUILD_TRACKERS = trackers
+    GG.LISTENER_URLS = urls
+    await GitHubClient.initialize(GG.GITHUB_TOKEN, orgs, GG.GITHUB_PREFETCH)
 
 
 async def get_settings(bot, guildId):
@@ -14,6 +14,12 @@ OWNER = int(os.environ['OWNER'])
 
 GITHUB_TOKEN = os.environ['GITHUB_TOKEN']
 GITHUB_REPO = os.environ['GITHUB_REPO']
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_PREFETCH = os.environ.get('GITHUB_PREFETCH', 'false').lower() == 'true'
+GITHUB_BODY_WINDOW = float(os.environ.get('GITHUB_BODY_WINDOW', 10))
+GITHUB_GRAPHQL = os.environ.get('GITHUB_GRAPHQL', 'false').lower() == 'true'
+GITHUB_APP_ID = os.environ.get('GITHUB_APP_ID')
+GITHUB_APP_PRIVATE_KEY = os.environ.get('GITHUB_APP_PRIVATE_KEY')
 MONGODB = os.environ['MONGODB']
 
 BOT = 574554734187380756
@@ -23,7 +29,9 @@ MDB = motor.motor_asyncio.AsyncIOMotorClient(MONGODB)['issuetracking']
 HELP = motor.motor_asyncio.AsyncIOMotorClient(MONGODB)['lookup']
 
 GITHUBSERVERS = []
+GUILD_TRACKERS = {}  # guild id -> tracker channel ids, kept current by loadGithubServers
 BUG_LISTEN_CHANS = []
+LISTENER_URLS = {}  # (identifier, tracker channel id) -> icon url
 ADMINS = []
 SERVERS = []
 
@@ -23,7 +23,7 @@ def get_all_tickets():
 
 
 async def finish_ticket_creation(self, interaction, ticket, ticketMessage, requestChannel, bug=False, support=False, forumPost=None):
-    await ticket.commit()
+    await ticket.apply(lambda ticket: ticket.commit())
     try:
         if self.author.dm_channel is not None:
             DM = self.author.dm_channel